@@ -4,151 +4,227 @@
 
 -- Load raw data
 CREATE OR REPLACE TABLE raw_data AS
-SELECT 
+SELECT
     ROW_NUMBER() OVER () - 1 AS Raw_ID,
     *
 FROM read_csv_auto('Grievances-Grid view 3.csv', header=true, all_varchar=true);
 
--- Normalize multi-value columns
-CREATE OR REPLACE TABLE normalized_data AS
-SELECT
-    Raw_ID,
-    ID,
-    "Date Filed" AS Date_Filed,
+-- Python str.strip(): TRIM() alone leaves tabs / newlines
+CREATE OR REPLACE MACRO strip(x) AS REGEXP_REPLACE(x, '^\s+|\s+$', '', 'g');
 
-    -- Suppliers
-    CASE 
-        WHEN Suppliers IS NULL OR TRIM(Suppliers) = '' THEN []
+-- "[A, B; C]" -> ['A', 'B', 'C'] (same rule as loader.split_entities:
+-- split on , or ;, trim, drop empty / nan / none)
+CREATE OR REPLACE MACRO split_entities(cell) AS
+    CASE
+        WHEN cell IS NULL OR strip(cell) = '' THEN []
         ELSE LIST_DISTINCT(LIST_FILTER(
             LIST_TRANSFORM(
-                STRING_SPLIT(REGEXP_REPLACE(Suppliers, '\[|\]', '', 'g'), ','), 
-                x -> TRIM(x)
-            ), x -> x != ''
+                REGEXP_SPLIT_TO_ARRAY(REGEXP_REPLACE(cell, '\[|\]', '', 'g'), '[,;]'),
+                x -> strip(x)
+            ), x -> x != '' AND LOWER(x) NOT IN ('nan', 'none')
         ))
-    END AS Suppliers,
+    END;
 
-    -- Mills
-    CASE 
-        WHEN Mills IS NULL OR TRIM(Mills) = '' THEN []
-        ELSE LIST_DISTINCT(LIST_FILTER(
-            LIST_TRANSFORM(
-                STRING_SPLIT(REGEXP_REPLACE(Mills, '\[|\]', '', 'g'), ','), 
-                x -> TRIM(x)
-            ), x -> x != ''
-        ))
-    END AS Mills,
-
-    -- PIOConcessions
-    CASE 
-        WHEN "PIOConcessions-v2" IS NULL OR TRIM("PIOConcessions-v2") = '' THEN []
-        ELSE LIST_DISTINCT(LIST_FILTER(
-            LIST_TRANSFORM(
-                STRING_SPLIT(REGEXP_REPLACE("PIOConcessions-v2", '\[|\]', '', 'g'), ','), 
-                x -> TRIM(x)
-            ), x -> x != ''
-        ))
-    END AS PIOConcessions,
-
-    -- Issues
-    CASE 
-        WHEN Issues IS NULL OR TRIM(Issues) = '' THEN []
-        ELSE LIST_DISTINCT(LIST_FILTER(
-            LIST_TRANSFORM(
-                STRING_SPLIT(REGEXP_REPLACE(Issues, '\[|\]', '', 'g'), ','), 
-                x -> TRIM(x)
-            ), x -> x != ''
-        ))
-    END AS Issues,
-
-    -- Source
-    CASE 
-        WHEN Source IS NULL OR TRIM(Source) = '' THEN []
+-- Normalize multi-value columns
+CREATE OR REPLACE TABLE normalized_data AS
+SELECT
+    Raw_ID,
+    ID,
+    TRY_STRPTIME("Date Filed", '%m/%d/%Y')::DATE AS Date_Filed,
+    split_entities(Suppliers) AS Suppliers,
+    split_entities(Mills) AS Mills,
+    split_entities("PIOConcessions-v2") AS PIOConcessions,
+    split_entities(Issues) AS Issues,
+
+    -- Source: split on a comma NOT followed by whitespace
+    -- ("Rapid Response 1,Rapid Response 15" -> 2, "Enough is Enough, ..." -> 1)
+    CASE
+        WHEN Source IS NULL OR strip(Source) = '' THEN []
         ELSE LIST_FILTER(
             LIST_TRANSFORM(
-                STRING_SPLIT(REPLACE(Source, ', ', '<<COMMA_SPACE>>'), ','), 
-                x -> TRIM(REPLACE(x, '<<COMMA_SPACE>>', ', '))
+                STRING_SPLIT(REGEXP_REPLACE(strip(Source), ',(\s)', '<<COMMA_SPACE>>\1', 'g'), ','),
+                x -> strip(REPLACE(x, '<<COMMA_SPACE>>', ','))
             ), x -> x != ''
         )
     END AS Source_List
 
 FROM raw_data;
 
--- Expand rows by Source
+-- Expand rows by Source (grievances without a Source do not take part in Step 2)
+-- Row_ID follows file order, then Source order inside the cell
 CREATE OR REPLACE TABLE expanded_data AS
-SELECT 
-    ROW_NUMBER() OVER () - 1 AS Row_ID,
-    Raw_ID,
-    ID,
-    Date_Filed,
-    Suppliers,
-    Mills,
-    PIOConcessions,
-    Issues,
-    UNNEST(CASE WHEN LEN(Source_List) = 0 THEN [NULL] ELSE Source_List END) AS Source
-FROM normalized_data;
+SELECT
+    ROW_NUMBER() OVER (ORDER BY Raw_ID, Source_Pos) - 1 AS Row_ID,
+    *
+FROM (
+    SELECT
+        Raw_ID,
+        ID,
+        Date_Filed,
+        Suppliers,
+        Mills,
+        PIOConcessions,
+        Issues,
+        UNNEST(RANGE(LEN(Source_List))) AS Source_Pos,
+        UNNEST(Source_List) AS Source
+    FROM normalized_data
+);
 
 
 -- =====================================================
 -- STEP 2: MERGE PER SOURCE USING CONNECTED COMPONENTS
 -- =====================================================
 
--- Create pairwise edges: two rows are connected if they share a source AND overlap in Suppliers/Mills/PIOConcessions
+-- Long posting table: one row per (row, entity kind, entity) inside a Source
+CREATE OR REPLACE TABLE row_postings AS
+SELECT Row_ID, Source, 'Suppliers' AS kind, UNNEST(Suppliers) AS entity FROM expanded_data
+UNION ALL
+SELECT Row_ID, Source, 'Mills', UNNEST(Mills) FROM expanded_data
+UNION ALL
+SELECT Row_ID, Source, 'PIOConcessions', UNNEST(PIOConcessions) FROM expanded_data;
+
+-- Edges: two rows are connected if they share a source AND a supplier / mill / plot.
+-- Hash equi-join on (Source, kind, entity) against the first row of each
+-- posting list: a star per entity connects the same rows as every pair
+-- would (as union_find.cluster_entities does) and stays linear in the
+-- posting-list sizes.
 CREATE OR REPLACE TABLE overlap_edges AS
-SELECT 
-    a.Row_ID AS Row_A,
-    b.Row_ID AS Row_B
-FROM expanded_data a
-JOIN expanded_data b
-  ON a.Source = b.Source
- AND a.Row_ID < b.Row_ID  -- avoid duplicate pairs
-WHERE
-    ARRAY_LENGTH(ARRAY_INTERSECT(a.Suppliers, b.Suppliers)) > 0
- OR ARRAY_LENGTH(ARRAY_INTERSECT(a.Mills, b.Mills)) > 0
- OR ARRAY_LENGTH(ARRAY_INTERSECT(a.PIOConcessions, b.PIOConcessions)) > 0;
-
--- Use recursive CTE to find connected components (each component = event)
-WITH RECURSIVE components AS (
-    -- Anchor: each node starts as its own component
-    SELECT Row_ID AS node, Row_ID AS component
-    FROM expanded_data
-
+SELECT DISTINCT
+    f.First_Row AS Row_A,
+    p.Row_ID AS Row_B
+FROM row_postings p
+JOIN (
+    SELECT Source, kind, entity, MIN(Row_ID) AS First_Row
+    FROM row_postings
+    GROUP BY Source, kind, entity
+) f
+  ON p.Source = f.Source
+ AND p.kind = f.kind
+ AND p.entity = f.entity
+WHERE p.Row_ID > f.First_Row;
+
+-- Connected components by min-label propagation: every row starts with its
+-- own Row_ID, and each round only the rows whose label dropped push it to
+-- their neighbours. USING KEY keeps one label per row (the recursion updates
+-- it in place instead of appending every path), so the work per round is
+-- bounded by the edges of the changed rows; it stops when no label drops.
+-- Component label = smallest Row_ID in the component.
+CREATE OR REPLACE TABLE row_components AS
+WITH RECURSIVE
+edges AS (
+    SELECT Row_A AS src, Row_B AS dst FROM overlap_edges
     UNION ALL
+    SELECT Row_B, Row_A FROM overlap_edges
+),
+components (Row_ID, Component) USING KEY (Row_ID) AS (
+    SELECT Row_ID, Row_ID FROM expanded_data
+
+    UNION
 
-    -- Recursive step: assign smallest component ID among connected nodes
-    SELECT e.Row_B AS node,
-           c.component AS component
+    SELECT e.dst, MIN(c.Component)
     FROM components c
-    JOIN overlap_edges e
-      ON e.Row_A = c.node
-     AND e.Row_B <> c.component
-)
--- Get final component ID per row
-, final_components AS (
-    SELECT node AS Row_ID,
-           MIN(component) AS Event_Component
-    FROM components
-    GROUP BY node
+    JOIN edges e ON e.src = c.Row_ID
+    JOIN recurring.components r ON r.Row_ID = e.dst
+    GROUP BY e.dst
+    HAVING MIN(c.Component) < MIN(r.Component)
 )
+SELECT Row_ID, Component FROM components;
 
--- Aggregate per Event_Component
+-- Aggregate per component: one event per (Source, component), numbered in
+-- Source order then component order (same EVT_ numbering as merge_per_source)
 CREATE OR REPLACE TABLE step2_events AS
 SELECT
-    CONCAT('EVT_', DENSE_RANK() OVER (ORDER BY fc.Event_Component)) AS Event_ID,
+    CONCAT('EVT_', ROW_NUMBER() OVER (ORDER BY e.Source, rc.Component)) AS Event_ID,
+    ROW_NUMBER() OVER (ORDER BY e.Source, rc.Component) AS Event_No,
     e.Source,
-    LIST_DISTINCT(ARRAY_CONCAT_AGG(e.Suppliers)) AS Suppliers,
-    LIST_DISTINCT(ARRAY_CONCAT_AGG(e.Mills)) AS Mills,
-    LIST_DISTINCT(ARRAY_CONCAT_AGG(e.PIOConcessions)) AS PIOConcessions,
-    LIST_DISTINCT(ARRAY_CONCAT_AGG(e.Issues)) AS Issues,
-    LIST_DISTINCT(ARRAY_AGG(e.ID)) AS Grievance_List,
+    LIST_SORT(LIST_DISTINCT(FLATTEN(LIST(e.Suppliers)))) AS Suppliers,
+    LIST_SORT(LIST_DISTINCT(FLATTEN(LIST(e.Mills)))) AS Mills,
+    LIST_SORT(LIST_DISTINCT(FLATTEN(LIST(e.PIOConcessions)))) AS PIOConcessions,
+    LIST_SORT(LIST_DISTINCT(FLATTEN(LIST(e.Issues)))) AS Issues,
+    LIST_SORT(LIST_DISTINCT(LIST(e.ID))) AS Grievance_List,
     COUNT(DISTINCT e.ID) AS Grievance_Count,
-    MIN(STRPTIME(e.Date_Filed, '%m/%d/%Y')) AS Earliest_Date,
-    MAX(STRPTIME(e.Date_Filed, '%m/%d/%Y')) AS Latest_Date
+    LIST_SORT(LIST_DISTINCT(LIST(e.Date_Filed))) AS Date_Filed_List,
+    MIN(e.Date_Filed) AS Date_Filed
 FROM expanded_data e
-JOIN final_components fc
-  ON e.Row_ID = fc.Row_ID
-GROUP BY fc.Event_Component, e.Source
-ORDER BY Event_ID;
+JOIN row_components rc
+  ON e.Row_ID = rc.Row_ID
+GROUP BY e.Source, rc.Component
+ORDER BY Event_No;
 
--- Check results
 SELECT COUNT(*) AS total_events_after_step2 FROM step2_events;
-SELECT * FROM step2_events;
+
+
+-- =====================================================
+-- STEP 3: MERGE EVENTS ACROSS SOURCES (NO TIME WINDOW)
+-- =====================================================
+
+-- Event postings, same long layout (no Source: Step 3 crosses sources)
+CREATE OR REPLACE TABLE event_postings AS
+SELECT Event_No, 'Suppliers' AS kind, UNNEST(Suppliers) AS entity FROM step2_events
+UNION ALL
+SELECT Event_No, 'Mills', UNNEST(Mills) FROM step2_events
+UNION ALL
+SELECT Event_No, 'PIOConcessions', UNNEST(PIOConcessions) FROM step2_events;
+
+-- Event pairs sharing an entity of the given kinds (hash equi-join on kind + entity)
+CREATE OR REPLACE MACRO shared_pairs(kinds) AS TABLE
+SELECT DISTINCT a.Event_No AS Event_A, b.Event_No AS Event_B
+FROM event_postings a
+JOIN event_postings b
+  ON a.kind = b.kind
+ AND a.entity = b.entity
+ AND a.Event_No < b.Event_No
+WHERE LIST_CONTAINS(kinds, a.kind);
+
+-- Two events connect if they share a supplier AND a mill or plot
+-- (same rule as RG-Notw.py Step 3). Components stop at these pairwise edges;
+-- RG-Notw.py also re-tests merged clusters on their accumulated entities
+-- (incidence.step3_fixpoint), 520 instead of 532 MHIDs on the current export.
+CREATE OR REPLACE TABLE event_edges AS
+SELECT * FROM shared_pairs(['Suppliers'])
+INTERSECT
+SELECT * FROM shared_pairs(['Mills', 'PIOConcessions']);
+
+-- Same min-label propagation over events
+CREATE OR REPLACE TABLE event_components AS
+WITH RECURSIVE
+edges AS (
+    SELECT Event_A AS src, Event_B AS dst FROM event_edges
+    UNION ALL
+    SELECT Event_B, Event_A FROM event_edges
+),
+components (Event_No, Component) USING KEY (Event_No) AS (
+    SELECT Event_No, Event_No FROM step2_events
+
+    UNION
+
+    SELECT e.dst, MIN(c.Component)
+    FROM components c
+    JOIN edges e ON e.src = c.Event_No
+    JOIN recurring.components r ON r.Event_No = e.dst
+    GROUP BY e.dst
+    HAVING MIN(c.Component) < MIN(r.Component)
+)
+SELECT Event_No, Component FROM components;
+
+-- One MHID per component, numbered by its first event
+CREATE OR REPLACE TABLE step3_mhids AS
+SELECT
+    CONCAT('MHID_', DENSE_RANK() OVER (ORDER BY ec.Component)) AS MHID,
+    LIST_SORT(LIST_DISTINCT(FLATTEN(LIST(s.Suppliers)))) AS Suppliers,
+    LIST_SORT(LIST_DISTINCT(FLATTEN(LIST(s.Mills)))) AS Mills,
+    LIST_SORT(LIST_DISTINCT(FLATTEN(LIST(s.PIOConcessions)))) AS PIOConcessions,
+    LIST_SORT(LIST_DISTINCT(FLATTEN(LIST(s.Issues)))) AS Issues,
+    LIST_SORT(LIST_DISTINCT(LIST(s.Source))) AS Source,
+    LIST_SORT(LIST_DISTINCT(FLATTEN(LIST(s.Grievance_List)))) AS Grievance_List,
+    LEN(LIST_DISTINCT(FLATTEN(LIST(s.Grievance_List)))) AS Grievance_Count,
+    LIST(s.Event_ID ORDER BY s.Event_No) AS Event_List
+FROM step2_events s
+JOIN event_components ec
+  ON s.Event_No = ec.Event_No
+GROUP BY ec.Component
+ORDER BY ec.Component;
+
+-- Check results
+SELECT COUNT(*) AS total_mhids_after_step3 FROM step3_mhids;
+SELECT * FROM step3_mhids;
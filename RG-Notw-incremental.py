@@ -0,0 +1,121 @@
+# Incremental version of RG-Notw.py (same merge rules, no time window).
+# First run builds the state from the whole export; later runs only apply the
+# grievances whose ID + Last Modified changed and re-emit the MHIDs they touch.
+#
+#   python RG-Notw-incremental.py          -> Final_Merged_Notw_delta.csv
+#   python RG-Notw-incremental.py --full   -> also Final_Merged_Notw.csv from the state
+
+import sys
+
+import pandas as pd
+
+from loader import INPUT_FILE, load_grievances, read_lookup
+from incremental import STATE_FILE, load_state, save_state, apply_export
+from vocab import decode_columns
+
+# =====================================================
+# CONFIG
+# =====================================================
+DELTA_OUT = "Final_Merged_Notw_delta.csv"
+FINAL_OUT = "Final_Merged_Notw.csv"
+FULL = "--full" in sys.argv[1:]
+
+# =====================================================
+# STEP 1-3 – APPLY THE EXPORT TO THE SAVED STATE
+# =====================================================
+print("\n[STEP 1-3] Diff export against", STATE_FILE, "...")
+
+state = load_state(STATE_FILE)
+first_new = state["next_mhid"]
+export = load_grievances(INPUT_FILE)
+updated, removed, stats = apply_export(state, export)
+save_state(state, STATE_FILE)
+
+print(f"✓ Grievances: {stats['new']} new, {stats['changed']} changed, {stats['deleted']} deleted")
+print(f"✓ MHIDs: {len(updated)} new/updated, {len(removed)} removed, {len(state['mhids'])} total")
+
+def mhid_frame(mhids):
+    cols = ["MHID", "Suppliers", "Mills", "PIOConcessions", "Issues", "Source",
+            "Grievance_List", "Grievance_Count"]
+    df_out = pd.DataFrame([state["mhids"][m] for m in mhids], columns=cols)
+    # codes -> names for the group lookups and the CSV
+    return decode_columns(df_out, state["vocabs"])
+
+# =====================================================
+# STEP 4 – ADD GROUP INFO + AIRTABLE GROUPS
+# =====================================================
+pio_file = "Concessions-v2-Grid view (5).csv"
+mills_file = "Mills-Grid view (10).csv"
+
+df_pio = read_lookup(pio_file)
+df_mills = read_lookup(mills_file)
+
+pio_group = pd.Series(df_pio["Group"].values, index=df_pio["ID"]).to_dict()
+pio_airtable = pd.Series(df_pio["GroupAirtableRecID"].values, index=df_pio["ID"]).to_dict()
+
+mills_group = pd.Series(df_mills["Group"].values, index=df_mills["UML_ID"]).to_dict()
+mills_airtable = pd.Series(df_mills["GroupAirtableRecID"].values, index=df_mills["UML_ID"]).to_dict()
+
+def get_groups(ids_list, mapping_dict):
+    valid = []
+    for i in ids_list:
+        if i in mapping_dict and pd.notna(mapping_dict[i]):
+            valid.append(str(mapping_dict[i]))
+    return ", ".join(sorted(set(valid))) if valid else ""
+
+# =====================================================
+# STEP 5 – COMPANY TRACKER LOOKUP (FROM THE STATE)
+# =====================================================
+tracker_dict = state["tracker"]
+
+def lookup_tracker(grievance_ids):
+    companies = []
+    rec_ids = []
+
+    for gid in grievance_ids:
+        if gid in tracker_dict:
+            comp = tracker_dict[gid]["Company Tracker"]
+            rec = tracker_dict[gid]["Tracker Company AirtableRecIDs"]
+
+            if pd.notna(comp):
+                companies.append(comp)
+            if pd.notna(rec):
+                rec_ids.append(rec)
+
+    return (
+        ", ".join(sorted(set(companies))),
+        ", ".join(sorted(set(rec_ids)))
+    )
+
+def finish(df_out):
+    """Steps 4-5 + output cleaning, as in RG-Notw.py"""
+    df_out["Plot_Group"] = df_out["PIOConcessions"].apply(lambda x: get_groups(x, pio_group))
+    df_out["Plot_AirtableID_Group"] = df_out["PIOConcessions"].apply(lambda x: get_groups(x, pio_airtable))
+
+    df_out["Mill_Group"] = df_out["Mills"].apply(lambda x: get_groups(x, mills_group))
+    df_out["Mill_AirtableID_Group"] = df_out["Mills"].apply(lambda x: get_groups(x, mills_airtable))
+
+    tracker = df_out["Grievance_List"].apply(lookup_tracker)
+    df_out["Company_Tracker"] = [t[0] for t in tracker]
+    df_out["Tracker_Company_AirtableRecIDs"] = [t[1] for t in tracker]
+
+    for col in ["Suppliers","Mills","PIOConcessions","Issues","Source","Grievance_List"]:
+        df_out[col] = df_out[col].apply(lambda x: ", ".join(sorted(set(x))))
+    return df_out
+
+# =====================================================
+# OUTPUT – ONLY THE TOUCHED MHIDs
+# =====================================================
+df_delta = finish(mhid_frame(updated))
+is_new = df_delta["MHID"].str.split("_").str[1].astype(int) >= first_new
+df_delta.insert(1, "Status", ["new" if n else "updated" for n in is_new])
+df_removed = pd.DataFrame({"MHID": removed, "Status": "removed"})
+df_delta = pd.concat([df_delta, df_removed], ignore_index=True)
+df_delta.to_csv(DELTA_OUT, index=False)
+print("Delta saved to:", DELTA_OUT)
+
+if FULL:
+    order = sorted(state["mhids"], key=lambda m: int(m.split("_")[1]))
+    df_final = finish(mhid_frame(order))
+    df_final.to_csv(FINAL_OUT, index=False)
+    print("Full output saved to:", FINAL_OUT, f"({len(df_final)} MHIDs)")
@@ -1,35 +1,20 @@
+import numpy as np
 import pandas as pd
-import re
-from datetime import datetime
+
+from loader import INPUT_FILE, SOURCE_SPLIT_NOTW, load_normalized, expand_sources, read_lookup
+from incidence import entity_blocks, step3_edges, step3_fixpoint
+from union_find import cluster_pairs, group_members
+from events import merge_per_source
+from vocab import union_codes, decode_columns
 
 # =====================================================
 # CONFIG
 # =====================================================
-INPUT_FILE = "Grievances-Grid view 3.csv"
 FINAL_OUT = "Final_Merged_Notw.csv"
 
 # =====================================================
 # HELPERS
 # =====================================================
-def split_list(cell):
-    if pd.isna(cell) or str(cell).strip() == "":
-        return []
-    s = str(cell).replace("[", "").replace("]", "")
-    parts = [p.strip() for p in re.split("[,;]", s)]
-    return list({p for p in parts if p})
-
-def split_source(val):
-    if pd.isna(val) or str(val).strip() == "":
-        return []
-    s = str(val).strip()
-    parts = re.split(r",(?=\S)", s)
-    return [p.strip() for p in parts if p.strip()]
-
-def to_list(cell):
-    if pd.isna(cell) or str(cell).strip() == "":
-        return []
-    return [x.strip() for x in str(cell).split(",") if x.strip()]
-
 def uniq_list(x):
     return sorted(list(set(x)))
 
@@ -38,34 +23,14 @@ def uniq_list(x):
 # =====================================================
 print("\n[STEP 1] Load & Normalize...")
 
-df = pd.read_csv(INPUT_FILE, dtype=str)
-df.columns = [c.strip() for c in df.columns]
-df["Raw_ID"] = df.index.astype(int)
-
-multi_cols = ["Suppliers", "Mills", "PIOConcessions", "Issues"]
-
-for col in multi_cols:
-    df[col] = df[col].apply(split_list)
-
-df["Source"] = df["Source"].apply(split_source)
+# parsed + split once (shared with run_scenarios.py): pruned columns, dates as
+# datetimes, entity names -> sorted int32 code arrays (decoded only at export)
+df, vocabs = load_normalized(INPUT_FILE)
 
-expanded_rows = []
-
-for _, row in df.iterrows():
-    sources = row["Source"]
-
-    if len(sources) == 0:
-        new_row = row.copy()
-        new_row["Source"] = None
-        expanded_rows.append(new_row)
-    else:
-        for s in sources:
-            new_row = row.copy()
-            new_row["Source"] = s
-            expanded_rows.append(new_row)
-
-df_expanded = pd.DataFrame(expanded_rows)
-df_expanded["Row_ID"] = df_expanded.index.astype(int)
+# one row per Source (vectorized explode, only the columns Steps 2-3 use)
+# (Source split on a comma followed by a non-space, as before)
+df_expanded = expand_sources(df, pattern=SOURCE_SPLIT_NOTW)
+df_expanded["Source"] = vocabs["Source"].codes(df_expanded["Source"])
 
 print("✓ Total expanded rows:", len(df_expanded))
 
@@ -74,66 +39,8 @@ print("✓ Total expanded rows:", len(df_expanded))
 # =====================================================
 print("\n[STEP 2] Clustering by Source...")
 
-events = []
-event_id = 1
-
-for source, group in df_expanded.groupby("Source"):
-    source_events = []
-
-    for _, row in group.iterrows():
-        sup = set(row["Suppliers"])
-        mil = set(row["Mills"])
-        pio = set(row["PIOConcessions"])
-        iss = set(row["Issues"])
-
-        gid = row["ID"]
-        date_filed = row["Date Filed"]
-
-        merged = False
-
-        for evt in source_events:
-
-            overlap = (
-                len(sup & set(evt["Suppliers"])) > 0 or
-                len(mil & set(evt["Mills"])) > 0 or
-                len(pio & set(evt["PIOConcessions"])) > 0
-            )
-
-            if overlap:
-                evt["Suppliers"] = uniq_list(evt["Suppliers"] + list(sup))
-                evt["Mills"] = uniq_list(evt["Mills"] + list(mil))
-                evt["PIOConcessions"] = uniq_list(evt["PIOConcessions"] + list(pio))
-                evt["Issues"] = uniq_list(evt["Issues"] + list(iss))
-
-                evt["Grievance_List"].append(gid)
-                evt["Grievance_List"] = uniq_list(evt["Grievance_List"])
-                evt["Grievance_Count"] = len(evt["Grievance_List"])
-
-                evt["Date_Filed_List"].append(date_filed)
-                evt["Date_Filed_List"] = uniq_list(evt["Date_Filed_List"])
-                evt["Date_Filed"] = min(evt["Date_Filed_List"])
-
-                merged = True
-                break
-
-        if not merged:
-            source_events.append({
-                "Event_ID": f"EVT_{event_id}",
-                "Source": source,
-                "Suppliers": list(sup),
-                "Mills": list(mil),
-                "PIOConcessions": list(pio),
-                "Issues": list(iss),
-                "Grievance_List": [gid],
-                "Grievance_Count": 1,
-                "Date_Filed_List": [date_filed],
-                "Date_Filed": date_filed
-            })
-            event_id += 1
-
-    events.extend(source_events)
-
-df_step2 = pd.DataFrame(events)
+# connected components over shared suppliers / mills / plots, per Source
+df_step2 = merge_per_source(df_expanded)
 print("✓ Total events after Step 2:", len(df_step2))
 
 # =====================================================
@@ -141,57 +48,37 @@ print("✓ Total events after Step 2:", len(df_step2))
 # =====================================================
 print("\n[STEP 3] Final MHID merge...")
 
-for col in ["Suppliers","Mills","PIOConcessions","Issues","Grievance_List","Source"]:
-    df_step2[col] = df_step2[col].apply(lambda x: x if isinstance(x, list) else to_list(x))
-
-merged_events = []
-mhid = 1
+df_step2["Source"] = df_step2["Source"].apply(lambda s: np.array([s], dtype=np.int32))
 
-for _, row in df_step2.iterrows():
+# ✅ New logic: MUST overlap in supplier AND infra
+# sparse incidence blocks: (supplier overlap) AND (mill OR plot overlap)
+pairs = step3_edges(entity_blocks(df_step2, vocabs))
 
-    merged = False
-
-    for evt in merged_events:
-
-        supplier_overlap = len(set(row["Suppliers"]) & set(evt["Suppliers"])) >= 1
-
-        row_has_infra = len(row["Mills"]) > 0 or len(row["PIOConcessions"]) > 0
-        evt_has_infra = len(evt["Mills"]) > 0 or len(evt["PIOConcessions"]) > 0
-
-        infra_overlap = (
-            len(set(row["Mills"]) & set(evt["Mills"])) >= 1 or
-            len(set(row["PIOConcessions"]) & set(evt["PIOConcessions"])) >= 1
-        )
-
-        # ✅ New logic: MUST overlap in supplier AND infra
-        if supplier_overlap and infra_overlap:
-
-            evt["Suppliers"] = uniq_list(evt["Suppliers"] + row["Suppliers"])
-            evt["Mills"] = uniq_list(evt["Mills"] + row["Mills"])
-            evt["PIOConcessions"] = uniq_list(evt["PIOConcessions"] + row["PIOConcessions"])
-            evt["Issues"] = uniq_list(evt["Issues"] + row["Issues"])
-            evt["Source"] = uniq_list(evt["Source"] + row["Source"])
-            evt["Grievance_List"] = uniq_list(evt["Grievance_List"] + row["Grievance_List"])
-
-            evt["Grievance_Count"] = len(evt["Grievance_List"])
-            merged = True
-            break
+# connected components, then merged clusters are re-tested on their
+# accumulated suppliers / mills / plots until nothing changes
+labels = step3_fixpoint(df_step2, vocabs, cluster_pairs(len(df_step2), pairs))
+merged_events = []
 
-    if not merged:
-        merged_events.append({
-            "MHID": f"MHID_{mhid}",
-            "Suppliers": row["Suppliers"],
-            "Mills": row["Mills"],
-            "PIOConcessions": row["PIOConcessions"],
-            "Issues": row["Issues"],
-            "Source": row["Source"],
-            "Grievance_List": row["Grievance_List"],
-            "Grievance_Count": len(row["Grievance_List"])
-        })
-        mhid += 1
+for mhid, members in enumerate(group_members(labels), start=1):
+    sub = df_step2.iloc[members]
+
+    grievances = uniq_list(sum(sub["Grievance_List"], []))
+    merged_events.append({
+        "MHID": f"MHID_{mhid}",
+        "Suppliers": union_codes(sub["Suppliers"]),
+        "Mills": union_codes(sub["Mills"]),
+        "PIOConcessions": union_codes(sub["PIOConcessions"]),
+        "Issues": union_codes(sub["Issues"]),
+        "Source": union_codes(sub["Source"]),
+        "Grievance_List": grievances,
+        "Grievance_Count": len(grievances)
+    })
 
 df_final = pd.DataFrame(merged_events)
 
+# codes -> names for the group lookups and the CSV
+decode_columns(df_final, vocabs)
+
 # =====================================================
 # STEP 4 – ADD GROUP INFO + AIRTABLE GROUPS
 # =====================================================
@@ -200,8 +87,8 @@ print("\n[STEP 4] Adding Plot & Mill Groups...")
 pio_file = "Concessions-v2-Grid view (5).csv"
 mills_file = "Mills-Grid view (10).csv"
 
-df_pio = pd.read_csv(pio_file, dtype=str)
-df_mills = pd.read_csv(mills_file, dtype=str)
+df_pio = read_lookup(pio_file)
+df_mills = read_lookup(mills_file)
 
 pio_group = pd.Series(df_pio["Group"].values, index=df_pio["ID"]).to_dict()
 pio_airtable = pd.Series(df_pio["GroupAirtableRecID"].values, index=df_pio["ID"]).to_dict()
@@ -229,8 +116,8 @@ print("✓ Added Plot & Mill group columns")
 # =====================================================
 print("\n[STEP 5] Adding company tracker columns...")
 
-df_lookup = pd.read_csv(INPUT_FILE, dtype=str)
-df_lookup = df_lookup[["ID", "Company Tracker", "Tracker Company AirtableRecIDs"]]
+# reuse the Step 1 frame instead of reading INPUT_FILE again
+df_lookup = df[["ID", "Company Tracker", "Tracker Company AirtableRecIDs"]]
 
 # Ensure 'ID' column is unique before setting it as index for to_dict('index')
 df_lookup = df_lookup.drop_duplicates(subset=['ID'], keep='first')
@@ -1,44 +1,24 @@
 #Split issues, if have deforestation...merge and no time window.
 #any grievances without deforestation/peatland loss, timw window 90
 
+import numpy as np
 import pandas as pd
-import re
-from datetime import datetime
+
+from loader import INPUT_FILE, NULL_TOKENS, load_normalized, expand_sources, read_lookup
+from entity_index import ENTITY_COLS, step3_window_pairs
+from union_find import cluster_entities, cluster_pairs, group_members
+from incidence import entity_blocks, step3_edges, step3_fixpoint
+from vocab import union_codes, decode_columns
 
 # =====================================================
 # CONFIG
 # =====================================================
-INPUT_FILE = "Grievances-Grid view 3.csv"
 FINAL_OUT = "Final_Merged_splitissue_splittime.csv"
 TIME_WINDOW_DAYS = 90 
 
 # =====================================================
 # HELPERS
 # =====================================================
-def split_list(cell):
-    if pd.isna(cell) or str(cell).strip() == "":
-        return []
-    s = str(cell).replace("[", "").replace("]", "")
-    parts = [p.strip() for p in re.split("[,;]", s)]
-    return [p for p in parts if p and p.lower() not in ("nan","none")]
-
-def split_source(val):
-    if pd.isna(val) or str(val).strip() == "":
-        return []
-    parts = re.split(r",(?![\s])", str(val))
-    return [p.strip() for p in parts if p.strip() and p.lower() not in ("nan","none")]
-
-def normalize_list(lst):
-    out = []
-    for v in lst or []:
-        if pd.isna(v):
-            continue
-        s = str(v).strip()
-        if s == "" or s.lower() in ("nan","none"):
-            continue
-        out.append(s)
-    return out
-
 def uniq_list(x):
     return sorted(list(dict.fromkeys(x)))
 
@@ -48,11 +28,6 @@ def parse_date_safe(x):
     except Exception:
         return pd.NaT
 
-def time_overlap(d1, d2, window_days):
-    if pd.isna(d1) or pd.isna(d2):
-        return False
-    return abs((d1 - d2).days) <= window_days
-
 def contains_deforestation_or_peat(issues):
     for i in issues or []:
         if not i: continue
@@ -66,30 +41,18 @@ def contains_deforestation_or_peat(issues):
 # =====================================================
 print("[STEP 1] Load + Normalize")
 
-df = pd.read_csv(INPUT_FILE, dtype=str)
-df.columns = [c.strip() for c in df.columns]
-df["Raw_ID"] = df.index.astype(int)
-
-multi_cols = ["Suppliers", "Mills", "PIOConcessions", "Issues"]
-for col in multi_cols:
-    df[col] = df[col].apply(split_list)
+# parsed + split once (shared with run_scenarios.py): pruned columns, dates as
+# datetimes, entity names -> sorted int32 code arrays (decoded only at export)
+# ("nan" / "none" placeholders dropped from entity and Source lists, as before)
+df, vocabs = load_normalized(INPUT_FILE, NULL_TOKENS)
 
-df["Source"] = df["Source"].apply(split_source)
+# one row per Source (vectorized explode, only the columns Steps 2-3 use)
+df_expanded = expand_sources(df, null_tokens=NULL_TOKENS).reset_index(drop=True)
+df_expanded["Source"] = vocabs["Source"].codes(df_expanded["Source"])
 
-expanded = []
-for _, r in df.iterrows():
-    sources = r["Source"]
-    if not sources:
-        new = r.copy()
-        new["Source"] = []
-        expanded.append(new)
-    else:
-        for s in sources:
-            new = r.copy()
-            new["Source"] = [s]
-            expanded.append(new)
-
-df_expanded = pd.DataFrame(expanded).reset_index(drop=True)
+# grievance ID; fallback: use Raw_ID for traceability
+gids = df_expanded["ID"].str.strip().fillna("")
+df_expanded["Grievance_ID"] = gids.where(gids != "", "RAW_" + df_expanded["Raw_ID"].astype(str))
 print("Expanded rows:", len(df_expanded))
 
 
@@ -99,54 +62,23 @@ print("Expanded rows:", len(df_expanded))
 print("[STEP 2] Merge per Source")
 
 events = []
-evt_id = 1
-
-# group by first source value (or None)
-group_keys = df_expanded["Source"].apply(lambda x: x[0] if isinstance(x, list) and x else None)
-for key, grp in df_expanded.groupby(group_keys):
-    source_events = []
-    for _, row in grp.iterrows():
-        sup = set(normalize_list(row.get("Suppliers", [])))
-        mil = set(normalize_list(row.get("Mills", [])))
-        pio = set(normalize_list(row.get("PIOConcessions", [])))
-        iss = normalize_list(row.get("Issues", []))
-        gid_raw = row.get("ID", "")
-        gid = str(gid_raw).strip() if pd.notna(gid_raw) else ""
-        if gid == "":
-            # fallback: use Raw_ID for traceability
-            gid = f"RAW_{row.get('Raw_ID','')}"
-        date_filed_raw = row.get("Date Filed", "")
-        date_filed = str(date_filed_raw).strip()
-
-        merged = False
-        for evt in source_events:
-            evt_sup = set(normalize_list(evt["Suppliers"]))
-            evt_mil = set(normalize_list(evt["Mills"]))
-            evt_pio = set(normalize_list(evt["PIOConcessions"]))
-
-            overlap = bool(sup & evt_sup) or bool(mil & evt_mil) or bool(pio & evt_pio)
-            if overlap:
-                evt["Suppliers"] = uniq_list(evt["Suppliers"] + list(sup))
-                evt["Mills"] = uniq_list(evt["Mills"] + list(mil))
-                evt["PIOConcessions"] = uniq_list(evt["PIOConcessions"] + list(pio))
-                evt["Issues"] = uniq_list(evt["Issues"] + iss)
-                evt["Grievance_List"].append(gid)
-                evt["Date_Filed_List"].append(date_filed)
-                merged = True
-                break
-        if not merged:
-            source_events.append({
-                "Event_ID": f"EVT_{evt_id}",
-                "Source": [key] if key is not None else [],
-                "Suppliers": list(sup),
-                "Mills": list(mil),
-                "PIOConcessions": list(pio),
-                "Issues": iss,
-                "Grievance_List": [gid],
-                "Date_Filed_List": [date_filed]
-            })
-            evt_id += 1
-    events.extend(source_events)
+
+# group by source (rows without a source are skipped, as before)
+for key, grp in df_expanded.groupby("Source"):
+    # connected components over shared suppliers / mills / plots
+    labels = cluster_entities(grp[ENTITY_COLS].to_dict("records"), ENTITY_COLS)
+    for members in group_members(labels):
+        sub = grp.iloc[members]
+        events.append({
+            "Event_ID": f"EVT_{len(events) + 1}",
+            "Source": np.array([key], dtype=np.int32),
+            "Suppliers": union_codes(sub["Suppliers"]),
+            "Mills": union_codes(sub["Mills"]),
+            "PIOConcessions": union_codes(sub["PIOConcessions"]),
+            "Issues": union_codes(sub["Issues"]),
+            "Grievance_List": sub["Grievance_ID"].tolist(),
+            "Date_Filed_List": sub["Date Filed"].tolist()
+        })
 
 df_step2 = pd.DataFrame(events)
 print("Step2 events:", len(df_step2))
@@ -154,8 +86,11 @@ print("Step2 events:", len(df_step2))
 # =====================================================
 # STEP 2.5 – SPLIT GROUP A / B berdasarkan Issues
 # =====================================================
-df_step2["Issues"] = df_step2["Issues"].apply(lambda x: normalize_list(x))
-df_step2["Issue_Group"] = df_step2["Issues"].apply(lambda x: "A" if contains_deforestation_or_peat(x) else "B")
+# check each distinct Issue name once, then test events by code
+defo_issues = vocabs["Issues"].encode(
+    i for i in vocabs["Issues"].values if contains_deforestation_or_peat([i])
+)
+df_step2["Issue_Group"] = df_step2["Issues"].apply(lambda x: "A" if np.isin(x, defo_issues).any() else "B")
 
 groupA = df_step2[df_step2["Issue_Group"] == "A"].copy()
 groupB = df_step2[df_step2["Issue_Group"] == "B"].copy()
@@ -172,86 +107,44 @@ def finalize_merge(df_input, use_time_window):
         return min(arr) if arr else pd.NaT
 
     rows = df_input.to_dict("records")
-    # normalize rows in-place
-    norm_rows = []
     for r in rows:
-        nr = {}
-        nr["Suppliers"] = normalize_list(r.get("Suppliers", []))
-        nr["Mills"] = normalize_list(r.get("Mills", []))
-        nr["PIOConcessions"] = normalize_list(r.get("PIOConcessions", []))
-        nr["Issues"] = normalize_list(r.get("Issues", []))
         # ensure grievance list items are strings trimmed
-        nr["Grievance_List"] = [str(x).strip() for x in r.get("Grievance_List", []) if str(x).strip() and str(x).strip().lower() not in ("nan","none")]
-        nr["Date_Filed_dt"] = earliest_date(r.get("Date_Filed_List", []))
-        nr["Source"] = normalize_list(r.get("Source", []))
-        norm_rows.append(nr)
-
+        r["Grievance_List"] = [str(x).strip() for x in r.get("Grievance_List", []) if str(x).strip() and str(x).strip().lower() not in ("nan","none")]
+        r["Date_Filed_dt"] = earliest_date(r.get("Date_Filed_List", []))
+
+    # Merge rules:
+    # - If both have infra => require supplier_overlap AND infra_overlap (and time_ok if required)
+    # - Else (one/both missing infra) => require supplier_overlap (and time_ok if required)
+    if use_time_window:
+        # date-sorted sweep: only events inside the window are compared
+        entities = df_input[ENTITY_COLS].to_dict("records")
+        dates = [r["Date_Filed_dt"] for r in rows]
+        pairs = step3_window_pairs(entities, dates, TIME_WINDOW_DAYS, relaxed=True)
+    else:
+        pairs = step3_edges(entity_blocks(df_input, vocabs), relaxed=True)
+
+    # connected components instead of first-match: order of rows no longer matters;
+    # merged clusters are re-tested on their accumulated entities until stable
+    labels = step3_fixpoint(
+        df_input, vocabs, cluster_pairs(len(rows), pairs), relaxed=True,
+        dates=[r["Date_Filed_dt"] for r in rows] if use_time_window else None,
+        window_days=TIME_WINDOW_DAYS
+    )
     merged = []
-    for r in norm_rows:
-        did_merge = False
-        for evt in merged:
-            evt_sup = set(evt["Suppliers"])
-            evt_mil = set(evt["Mills"])
-            evt_pio = set(evt["PIOConcessions"])
-
-            supplier_overlap = bool(set(r["Suppliers"]) & evt_sup)
-
-            row_has_infra = bool(r["Mills"]) or bool(r["PIOConcessions"])
-            evt_has_infra = bool(evt["Mills"]) or bool(evt["PIOConcessions"])
-
-            infra_overlap = bool(set(r["Mills"]) & evt_mil) or bool(set(r["PIOConcessions"]) & evt_pio)
-
-            # determine time_ok if needed
-            time_ok = True
-            if use_time_window:
-                evt_latest = evt.get("Latest_Date_dt", pd.NaT)
-                time_ok = time_overlap(r["Date_Filed_dt"], evt_latest, TIME_WINDOW_DAYS)
-
-            # Merge rules:
-            # - If both have infra => require supplier_overlap AND infra_overlap (and time_ok if required)
-            # - Else (one/both missing infra) => require supplier_overlap (and time_ok if required)
-            if not supplier_overlap:
-                continue
-
-            if row_has_infra and evt_has_infra:
-                if not infra_overlap:
-                    continue
-            # else: supplier_overlap is enough
-
-            if use_time_window and not time_ok:
-                continue
-
-            # perform merge
-            evt["Suppliers"] = uniq_list(evt["Suppliers"] + r["Suppliers"])
-            evt["Mills"] = uniq_list(evt["Mills"] + r["Mills"])
-            evt["PIOConcessions"] = uniq_list(evt["PIOConcessions"] + r["PIOConcessions"])
-            evt["Issues"] = uniq_list(evt["Issues"] + r["Issues"])
-            evt["Source"] = uniq_list((evt.get("Source") or []) + r.get("Source", []))
-            evt["Grievance_List"] = uniq_list(evt["Grievance_List"] + r["Grievance_List"])
-            # update dates
-            all_dates = [d for d in [evt.get("Earliest_Date_dt", pd.NaT), evt.get("Latest_Date_dt", pd.NaT), r.get("Date_Filed_dt")] if not pd.isna(d)]
-            if all_dates:
-                evt["Earliest_Date_dt"] = min(all_dates)
-                evt["Latest_Date_dt"] = max(all_dates)
-            else:
-                evt["Earliest_Date_dt"] = pd.NaT
-                evt["Latest_Date_dt"] = pd.NaT
-
-            did_merge = True
-            break
-
-        if not did_merge:
-            merged.append({
-                # DO NOT assign MHID here to avoid duplicates across groups
-                "Suppliers": list(r["Suppliers"]),
-                "Mills": list(r["Mills"]),
-                "PIOConcessions": list(r["PIOConcessions"]),
-                "Issues": list(r["Issues"]),
-                "Source": list(r.get("Source", [])),
-                "Grievance_List": list(r["Grievance_List"]),
-                "Earliest_Date_dt": r.get("Date_Filed_dt", pd.NaT),
-                "Latest_Date_dt": r.get("Date_Filed_dt", pd.NaT)
-            })
+    for members in group_members(labels):
+        sub = [rows[i] for i in members]
+        all_dates = [r["Date_Filed_dt"] for r in sub if not pd.isna(r["Date_Filed_dt"])]
+        merged.append({
+            # DO NOT assign MHID here to avoid duplicates across groups
+            "Suppliers": union_codes(r["Suppliers"] for r in sub),
+            "Mills": union_codes(r["Mills"] for r in sub),
+            "PIOConcessions": union_codes(r["PIOConcessions"] for r in sub),
+            "Issues": union_codes(r["Issues"] for r in sub),
+            "Source": union_codes(r["Source"] for r in sub),
+            "Grievance_List": uniq_list(sum((r["Grievance_List"] for r in sub), [])),
+            "Earliest_Date_dt": min(all_dates) if all_dates else pd.NaT,
+            "Latest_Date_dt": max(all_dates) if all_dates else pd.NaT
+        })
 
     return merged
 
@@ -263,17 +156,14 @@ merged_B = finalize_merge(groupB, use_time_window=True)   # respect time window
 # =====================================================
 all_events = merged_A + merged_B
 
-# ensure each event is normalized lists (safety)
-for e in all_events:
-    for k in ["Suppliers","Mills","PIOConcessions","Issues","Source","Grievance_List"]:
-        e[k] = uniq_list(normalize_list(e.get(k, [])))
-
 # assign unique MHID sequentially
 for i, e in enumerate(all_events, start=1):
     e["MHID"] = f"MHID_{i:03d}"  # zero-padded, change padding if you want
 
 # convert to dataframe now
 df_final = pd.DataFrame(all_events)
+# codes -> sorted unique name lists
+decode_columns(df_final, vocabs)
 print("Final merged events:", len(df_final))
 
 # =====================================================
@@ -284,8 +174,8 @@ print("[STEP 4] Map groups & airtable IDs")
 pio_file = "Concessions-v2-Grid view (5).csv"
 mills_file = "Mills-Grid view (10).csv"
 
-df_pio = pd.read_csv(pio_file, dtype=str)
-df_mills = pd.read_csv(mills_file, dtype=str)
+df_pio = read_lookup(pio_file)
+df_mills = read_lookup(mills_file)
 
 pio_group = pd.Series(df_pio["Group"].values, index=df_pio["ID"]).to_dict()
 pio_air = pd.Series(df_pio["GroupAirtableRecID"].values, index=df_pio["ID"]).to_dict()
@@ -313,7 +203,8 @@ df_final["Mill_AirtableID_Group"] = df_final["Mills"].apply(lambda x: map_group_
 # =====================================================
 print("[STEP 5] Company tracker lookup")
 
-tracker_df = pd.read_csv(INPUT_FILE, dtype=str)
+# reuse the Step 1 frame instead of reading INPUT_FILE again
+tracker_df = df[["ID", "Company Tracker", "Tracker Company AirtableRecIDs"]].copy()
 if "ID" in tracker_df.columns:
     tracker_df["ID"] = tracker_df["ID"].astype(str).str.strip()
     tracker_df = tracker_df.drop_duplicates(subset=['ID'], keep='first').set_index("ID")
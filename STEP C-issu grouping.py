@@ -1,19 +1,20 @@
 # =========================================
 # LOAD Step 2 (output dari Step 2)
 # =========================================
-df2 = pd.read_csv("Step2.csv", dtype=str)
-df2.columns = [c.strip() for c in df2.columns]
+import numpy as np
 
-# Convert list-like columns menjadi Python list
+from stage_io import STEP2_FILE, STEP3_FILE, STEP3_LIST_COLS, STEP3_DATE_COLS, read_stage, write_stage
+from vocab import Vocab, union_codes
+
+# list columns sudah list (Parquet)
+df2 = read_stage(STEP2_FILE)
+
+# Issues Combined di CSV mentah masih string
 def to_list(cell):
     if pd.isna(cell) or cell.strip() == "":
         return []
     return [x.strip() for x in str(cell).split(",") if x.strip()]
 
-list_cols = ["Suppliers", "Mills", "PIOConcessions", "Issues", "Grievance_List"]
-for col in list_cols:
-    df2[col] = df2[col].apply(to_list)
-
 
 # =========================================
 # LOAD file tambahan (Grievances-grid view 2.csv)
@@ -22,19 +23,20 @@ for col in list_cols:
 df_original_grievances = pd.read_csv("Grievances-Grid view 2.csv", dtype=str)
 df_original_grievances.columns = [c.strip() for c in df_original_grievances.columns]
 
-# Convert Issues Combined ke list
-df_original_grievances["Issues Combined"] = df_original_grievances["Issues Combined"].apply(to_list)
+# Convert Issues Combined ke list, lalu ke int32 codes
+issues_lists = df_original_grievances["Issues Combined"].apply(to_list)
 
-# Create a mapping from original grievance ID to its 'Issues Combined'
+# codes dinomori urut nama: sorted codes == sorted names
+issue_vocab = Vocab.from_values(sorted({x for lst in issues_lists for x in lst}))
+df_original_grievances["Issues Combined"] = issues_lists.apply(issue_vocab.encode)
+
+# Create a mapping from original grievance ID to its 'Issues Combined' codes
 id_to_issues_combined_map = df_original_grievances.set_index('ID')['Issues Combined'].to_dict()
 
-# For each event in df2, collect all 'Issues Combined' from its constituent grievances
+# For each event in df2, union the issue codes of its constituent grievances
 def get_event_issues_combined(grievance_list_ids):
-    combined_issues = []
-    for gid in grievance_list_ids:
-        if gid in id_to_issues_combined_map:
-            combined_issues.extend(id_to_issues_combined_map[gid])
-    return sorted(list(set(combined_issues)))
+    return union_codes([id_to_issues_combined_map[gid] for gid in grievance_list_ids
+                        if gid in id_to_issues_combined_map])
 
 df2['Issues Combined'] = df2['Grievance_List'].apply(get_event_issues_combined)
 
@@ -71,6 +73,9 @@ for group, items in ISSUE_MAP.items():
     for it in items:
         ISSUE_TO_GROUP[it.lower()] = group
 
+# kategori per issue code (sekali per issue, bukan per event)
+CODE_TO_GROUP = np.array([ISSUE_TO_GROUP.get(v.lower(), "Other") for v in issue_vocab.values], dtype=object)
+
 
 # =========================================
 # STEP 3 – BUILDING GROUPED EVENTS
@@ -79,37 +84,22 @@ final_rows = []
 new_eid = 1
 
 for idx, row in df.iterrows():
-    issues_raw = row["Issues Combined"] if isinstance(row["Issues Combined"], list) else []
-    issues_raw = [x.strip() for x in issues_raw if x.strip()]
-
-    # tampung issues berdasarkan kategori
-    grouped = {}
-
-    for issue in issues_raw:
-        key = issue.lower()
-
-        if key in ISSUE_TO_GROUP:
-            cat = ISSUE_TO_GROUP[key]
-        else:
-            cat = "Other"
-
-        if cat not in grouped:
-            grouped[cat] = []
-        grouped[cat].append(issue)
+    codes = row["Issues Combined"]
+    cats = CODE_TO_GROUP[codes]
 
-    # Untuk setiap kategori → buat event baru
-    for cat, issue_list in grouped.items():
+    # Untuk setiap kategori (urutan kemunculan) → buat event baru
+    for cat in dict.fromkeys(cats):
         new_row = {
             "Event_ID_S3": f"EVT3_{new_eid}",
             "Original_Event_ID": row["Event_ID"],
             "Issue_Category": cat,
-            "Issues": ", ".join(sorted(set(issue_list))),
-            "Suppliers": ", ".join(row["Suppliers"]),
-            "Mills": ", ".join(row["Mills"]),
-            "PIOConcessions": ", ".join(row["PIOConcessions"]),
-            "Grievance_List": ", ".join(row["Grievance_List"]),
+            "Issues": issue_vocab.decode(codes[cats == cat]),
+            "Suppliers": row["Suppliers"],
+            "Mills": row["Mills"],
+            "PIOConcessions": row["PIOConcessions"],
+            "Grievance_List": row["Grievance_List"],
             "Grievance_Count": row["Grievance_Count"],
-            "Source": row["Source"]
+            "Source": [row["Source"]]
            "Date Filed": row["Date Filed"]
             
         }
@@ -118,7 +108,7 @@ for idx, row in df.iterrows():
 
 # Output akhir
 df_step3 = pd.DataFrame(final_rows)
-df_step3.to_csv("Step3.csv", index=False)
+write_stage(df_step3, STEP3_FILE, STEP3_LIST_COLS, STEP3_DATE_COLS)
 
 print("Step 3 selesai. Total events:", len(df_step3))
 df_step3.head(40)
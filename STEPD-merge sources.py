@@ -1,24 +1,22 @@
 import pandas as pd
-from datetime import datetime, timedelta
 
-# =========================================
-# LOAD Step 3
-# =========================================
-df3 = pd.read_csv("Step3.csv", dtype=str)
-df3.columns = [c.strip() for c in df3.columns]
-
-# Convert list-like columns ke Python list
-def to_list(cell):
-    if pd.isna(cell) or cell.strip() == "":
-        return []
-    return [x.strip() for x in str(cell).split(",") if x.strip()]
+from signature import code_signatures, shared, absorb
+from stage_io import STEP3_FILE, read_stage
+from vocab import new_vocabs, union_codes, decode_columns
 
-list_cols = ["Suppliers", "Mills", "PIOConcessions", "Grievance_List", "Source"]
-for col in list_cols:
-    df3[col] = df3[col].apply(to_list)
+# kolom list yang di-merge: int32 code arrays, nama hanya saat export
+MERGE_COLS = ["Suppliers", "Mills", "PIOConcessions", "Source", "Grievance_List"]
 
-# Convert Date Filed ke datetime
-df3["Date_Filed"] = pd.to_datetime(df3["Date_Filed"], errors='coerce')
+# =========================================
+# LOAD Step 3 (list columns sudah list, Date_Filed sudah datetime)
+# =========================================
+df3 = read_stage(STEP3_FILE, columns=[
+    "Issue_Category", "Suppliers", "Mills", "PIOConcessions", "Source",
+    "Grievance_List", "Grievance_Count", "Date_Filed"
+])
+vocabs = new_vocabs(MERGE_COLS)
+for col in MERGE_COLS:
+    df3[col] = df3[col].apply(vocabs[col].encode)
 
 # =========================================
 # Step 4 – Merge events berdasarkan entitas + issue + time window
@@ -39,31 +37,29 @@ def in_time_window(issue_cat, date_new, date_latest):
 # Loop per Issue Category
 for cat, group in df3.groupby("Issue_Category"):
     group = group.sort_values("Date_Filed").reset_index(drop=True)
+    # supplier / mill / plot bitsets per row; event bitsets grow in place on merge
+    sigs = code_signatures(group)
 
     active_events = []
+    active_sigs = []
 
-    for idx, row in group.iterrows():
+    for (idx, row), sig in zip(group.iterrows(), sigs):
         merged = False
 
-        for evt in active_events:
+        for evt, evt_sig in zip(active_events, active_sigs):
             # Count entitas yang overlap
-            ent_overlap = 0
-            ent_overlap += len(set(row["Suppliers"]) & set(evt["Suppliers"]))
-            ent_overlap += len(set(row["Mills"]) & set(evt["Mills"]))
-            ent_overlap += len(set(row["PIOConcessions"]) & set(evt["PIOConcessions"]))
+            ent_overlap = sum(shared(a, b) for a, b in zip(sig, evt_sig))
 
             # Check merge conditions: minimal 2 entitas + time window vs Latest_Date
             if ent_overlap >= 1 and in_time_window(cat, row["Date_Filed"], evt["Latest_Date"]):
                 # Merge event
-                evt["Suppliers"] = sorted(list(set(evt["Suppliers"]) | set(row["Suppliers"])))
-                evt["Mills"] = sorted(list(set(evt["Mills"]) | set(row["Mills"])))
-                evt["PIOConcessions"] = sorted(list(set(evt["PIOConcessions"]) | set(row["PIOConcessions"])))
-                evt["Source"] = sorted(list(set(evt["Source"]) | set(row["Source"])))
-                evt["Grievance_List"] = sorted(list(set(evt["Grievance_List"]) | set(row["Grievance_List"])))
+                for col in MERGE_COLS:
+                    evt[col] = union_codes([evt[col], row[col]])
                 evt["Grievance_Count"] = len(evt["Grievance_List"])
                 # Update earliest & latest Date Filed
                 evt["Earliest_Date"] = min(evt["Earliest_Date"], row["Date_Filed"])
                 evt["Latest_Date"] = max(evt["Latest_Date"], row["Date_Filed"])
+                absorb(evt_sig, sig)
                 merged = True
                 break
 
@@ -81,6 +77,7 @@ for cat, group in df3.groupby("Issue_Category"):
                 "Earliest_Date": row["Date_Filed"],
                 "Latest_Date": row["Date_Filed"]
             })
+            active_sigs.append(list(sig))
             mhid_id += 1
 
     # Tambahkan hasil per category ke merged_events
@@ -89,8 +86,9 @@ for cat, group in df3.groupby("Issue_Category"):
 # Convert ke DataFrame
 df_step4 = pd.DataFrame(merged_events)
 
-# Convert list → string untuk CSV
-for col in ["Suppliers", "Mills", "PIOConcessions", "Source", "Grievance_List"]:
+# Convert codes → nama → string untuk CSV
+decode_columns(df_step4, vocabs, MERGE_COLS)
+for col in MERGE_COLS:
     df_step4[col] = df_step4[col].apply(lambda x: ", ".join(x))
 
 # Convert Date Filed ke string
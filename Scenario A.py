@@ -1,10 +1,13 @@
 #Directly Merge if Sources + mills/plot overlap. 
 
+import numpy as np
 import pandas as pd
-import re
+
+from loader import INPUT_FILE, load_normalized, read_lookup, split_sources
+from union_find import cluster_keys, group_members
+from vocab import union_codes, decode_columns
 
 # CONFIG / INPUT FILES
-INPUT_FILE = "Grievances-Grid view 3.csv"
 PIO_FILE = "Concessions-v2-Grid view (5).csv"
 MILLS_FILE = "Mills-Grid view (10).csv"
 OUT_FILE = "Merged_Events_with_groups.csv"
@@ -12,111 +15,81 @@ OUT_FILE = "Merged_Events_with_groups.csv"
 # =====================================================
 # LOAD CSV
 # =====================================================
-df = pd.read_csv(INPUT_FILE, dtype=str)
-df.columns = [c.strip() for c in df.columns]
-df["Raw_ID"] = df.index.astype(int)
+# parsed + split once (shared with run_scenarios.py): pruned columns, dates as
+# datetimes, entity names -> sorted int32 code arrays (decoded only at export)
+df, vocabs = load_normalized(INPUT_FILE)
 
 # =====================================================
-# HELPERS: splitters + util
+# HELPERS
 # =====================================================
-def split_list(cell):
-    """Generic splitter for suppliers/mills/PiOConcessions/issues"""
-    if pd.isna(cell) or str(cell).strip() == "":
-        return []
-    s = str(cell).replace("[", "").replace("]", "")
-    parts = [p.strip() for p in re.split("[,;]", s)]
-    return [p for p in sorted(set(parts)) if p]
-
-def split_source(val):
-    """Special splitter for Source: split on comma NOT followed by space"""
-    if pd.isna(val) or str(val).strip() == "":
-        return []
-    s = str(val).strip()
-    parts = re.split(r",(?!\s)", s)   # split on comma NOT followed by a space
-    parts = [p.strip() for p in parts if p.strip()]
-    return parts
-
 def uniq_list(x):
     return sorted(list(set(x)))
 
-# ensure columns exist
-for c in ["Suppliers","Mills","PIOConcessions-v2","Issues","Source","ID","Company Tracker","Tracker Company AirtableRecIDs"]:
-    if c not in df.columns:
-        df[c] = ""
-
 # =====================================================
 # APPLY SPLITTERS
 # =====================================================
 multi_cols = ["Suppliers", "Mills", "PIOConcessions-v2", "Issues"]
-for col in multi_cols:
-    df[col] = df[col].apply(split_list)
 
-df["Source"] = df["Source"].apply(split_source)
+# same Source split as the other scripts (loader.split_sources), one code per
+# (row, source); rows without a source get an empty array
+sources = split_sources(df["Source"]).dropna()
+source_codes = pd.Series(vocabs["Source"].codes(sources).to_numpy(np.int32), index=sources.index)
+by_row = source_codes.groupby(level=0).unique()
+df["Source"] = [np.sort(by_row[i]) if i in by_row.index else np.empty(0, dtype=np.int32) for i in df.index]
 
 # =====================================================
 # STEP 2 — MERGE EVENTS (SOURCE + (MILLS OR PIO) overlap)
 # =====================================================
+# "shared Source AND shared mill/plot" == sharing a (source, mill) or (source, plot)
+# key, so the rule becomes plain key overlap for the union-find engine.
+# Keys come from joining the exploded source codes with the exploded mill /
+# plot codes on the row: source * n + code (plots offset past the mills).
+pos = pd.Series(np.arange(len(df)), index=df.index)
+row_source = pd.DataFrame({"row": pos[source_codes.index].to_numpy(), "s": source_codes.to_numpy(np.int64)})
+n_keys = len(vocabs["Mills"]) + len(vocabs["PIOConcessions-v2"])
+
+def source_keys(col, offset):
+    codes = df[col].explode().dropna()
+    row_code = pd.DataFrame({"row": pos[codes.index].to_numpy(), "c": codes.to_numpy(np.int64)})
+    keys = row_source.merge(row_code, on="row")
+    return keys["row"].to_numpy(), keys["s"].to_numpy() * n_keys + offset + keys["c"].to_numpy()
+
+mill_rows, mill_keys = source_keys("Mills", 0)
+plot_rows, plot_keys = source_keys("PIOConcessions-v2", len(vocabs["Mills"]))
+labels = cluster_keys(len(df), np.concatenate([mill_rows, plot_rows]), np.concatenate([mill_keys, plot_keys]))
+
 events = []
-event_id = 1
-
-for idx, row in df.iterrows():
-    sup = set(row["Suppliers"])
-    mil = set(row["Mills"])
-    pio = set(row["PIOConcessions-v2"])
-    iss = set(row["Issues"])
-    sources = set(row["Source"])
-    gid = row["ID"] if pd.notna(row.get("ID")) else f"ROW_{idx}"
-
-    merged = False
-
-    for evt in events:
-        evt_sources = set(evt["Sources"])
-        evt_mills = set(evt["Mills"])
-        evt_pios = set(evt["PIOConcessions-v2"])
-
-        source_overlap = len(sources & evt_sources) > 0
-        mill_overlap = len(mil & evt_mills) > 0
-        pio_overlap = len(pio & evt_pios) > 0
-
-        allow_merge = source_overlap and (mill_overlap or pio_overlap)
-
-        if allow_merge:
-            # merge sets
-            evt["Suppliers"] = uniq_list(set(evt["Suppliers"]) | sup)
-            evt["Mills"] = uniq_list(set(evt["Mills"]) | mil)
-            evt["PIOConcessions-v2"] = uniq_list(set(evt["PIOConcessions-v2"]) | pio)
-            evt["Issues"] = uniq_list(set(evt["Issues"]) | iss)
-            evt["Sources"] = uniq_list(set(evt["Sources"]) | sources)
-
-            # merge grievance list
-            evt["Grievance_List"].append(gid)
-            evt["Grievance_List"] = uniq_list(evt["Grievance_List"])
-            evt["Grievance_Count"] = len(evt["Grievance_List"])
-
-            merged = True
-            break
-
-    if not merged:
-        events.append({
-            "Event_ID": f"EVT_{event_id}",
-            "Suppliers": uniq_list(list(sup)),
-            "Mills": uniq_list(list(mil)),
-            "PIOConcessions-v2": uniq_list(list(pio)),
-            "Issues": uniq_list(list(iss)),
-            "Sources": uniq_list(list(sources)),
-            "Grievance_List": [gid],
-            "Grievance_Count": 1
-        })
-        event_id += 1
+
+for event_id, members in enumerate(group_members(labels), start=1):
+    sub = df.iloc[members]
+    grievance_ids = [
+        gid if pd.notna(gid) else f"ROW_{idx}"
+        for idx, gid in zip(sub.index, sub["ID"])
+    ]
+
+    events.append({
+        "Event_ID": f"EVT_{event_id}",
+        "Suppliers": union_codes(sub["Suppliers"]),
+        "Mills": union_codes(sub["Mills"]),
+        "PIOConcessions-v2": union_codes(sub["PIOConcessions-v2"]),
+        "Issues": union_codes(sub["Issues"]),
+        "Sources": union_codes(sub["Source"]),
+        "Grievance_List": uniq_list(grievance_ids),
+        "Grievance_Count": len(set(grievance_ids))
+    })
 
 df_final = pd.DataFrame(events)
 
+# codes -> names for the group lookups and the CSV
+decode_columns(df_final, vocabs, multi_cols)
+df_final["Sources"] = df_final["Sources"].apply(vocabs["Source"].decode)
+
 # =====================================================
 # STEP 4 — ADD PLOT & MILL GROUP LOOKUPS
 # =====================================================
 # load lookup tables
-df_pio = pd.read_csv(PIO_FILE, dtype=str)
-df_mills = pd.read_csv(MILLS_FILE, dtype=str)
+df_pio = read_lookup(PIO_FILE)
+df_mills = read_lookup(MILLS_FILE)
 
 # build mapping dicts
 pio_group = pd.Series(df_pio["Group"].values, index=df_pio["ID"]).to_dict() if "ID" in df_pio.columns and "Group" in df_pio.columns else {}
@@ -143,11 +116,8 @@ df_final["Mill_AirtableID_Group"] = df_final["Mills"].apply(lambda x: get_groups
 # STEP 5 — COMPANY TRACKER LOOKUP (FROM ORIGINAL FILE)
 # =====================================================
 # build tracker dict from original input file (ID -> Company Tracker, Tracker Company AirtableRecIDs)
-df_lookup = pd.read_csv(INPUT_FILE, dtype=str)
-for c in ["ID","Company Tracker","Tracker Company AirtableRecIDs"]:
-    if c not in df_lookup.columns:
-        df_lookup[c] = ""
-
+# reuse the frame loaded above instead of reading INPUT_FILE again
+df_lookup = df[["ID","Company Tracker","Tracker Company AirtableRecIDs"]]
 df_lookup = df_lookup.drop_duplicates(subset=['ID'], keep='first')
 tracker_dict = df_lookup.set_index("ID")[["Company Tracker","Tracker Company AirtableRecIDs"]].to_dict("index")
 
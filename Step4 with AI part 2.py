@@ -3,8 +3,15 @@
 
 import pandas as pd
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
+
+from date_band import band_dots, base_slices, later_partners, window_pairs
+from embedding_cache import EmbeddingCache
+from entity_index import ENTITY_COLS
+from incidence import incidence_matrix, weighted_jaccard
+from quantized_store import RowView
+from similarity import day_numbers, similar_pairs_by_key
+from stage_io import STEP3_FILE, read_stage
+from vocab import new_vocabs
 
 # ============================
 # CONFIG
@@ -12,6 +19,8 @@ from sklearn.metrics.pairwise import cosine_similarity
 PIO_WEIGHT = 0.35
 MILLS_WEIGHT = 0.35
 SUPPLIER_WEIGHT = 0.30
+# Jaccard per column, weighted and summed in this order
+ENTITY_WEIGHTS = {"PIOConcessions": PIO_WEIGHT, "Mills": MILLS_WEIGHT, "Suppliers": SUPPLIER_WEIGHT}
 
 MERGE_THRESHOLD = 0.70
 HIGH_THRESHOLD  = 0.50
@@ -20,74 +29,71 @@ AI_OVERRIDE_THRESHOLD = 0.85
 ENV_WINDOW = 90
 OTHER_WINDOW = 60
 
-model = SentenceTransformer("all-MiniLM-L6-v2")
+MODEL_NAME = "all-MiniLM-L6-v2"
+EMBEDDING_DTYPE = "int8"   # similarity scans: int8 / float16 / float32 (exact)
+
+
+def load_model():
+    # imported here: torch / sentence-transformers only load when some text
+    # is not in the embedding cache yet
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(MODEL_NAME)
 
 # ============================
 # LOAD DATA
 # ============================
-df = pd.read_csv("Step3.csv", dtype=str)
-
-def to_list(cell):
-    if pd.isna(cell) or cell.strip() == "":
-        return []
-    return [x.strip() for x in cell.split(",") if x.strip()]
-
-for col in ["Suppliers", "Mills", "PIOConcessions", "Grievance_List"]:
-    df[col] = df[col].apply(to_list)
+# Step 3 Parquet: list columns sudah list, Date_Filed sudah datetime
+df = read_stage(STEP3_FILE, columns=[
+    "Event_ID_S3", "Issue_Category", "Issues", "Suppliers", "Mills",
+    "PIOConcessions", "Grievance_List", "Source", "Date_Filed"
+])
 
-df["Date_Filed"] = pd.to_datetime(df["Date_Filed"], errors="coerce")
-df["Issue_Category"] = df["Issue_Category"].astype(str)
-df["Issues"] = df["Issues"].astype(str)
-df["Source"] = df["Source"].astype(str)
+# Issues / Source tetap dipakai sebagai teks (ai_text, output)
+df["Issues"] = df["Issues"].str.join(", ")
+df["Source"] = df["Source"].str.join(", ")
 
 # ============================
 # SIMILARITY FUNCTIONS
 # ============================
-def jaccard(a, b):
-    A, B = set(a), set(b)
-    if not A and not B:
-        return 0.0
-    return len(A & B) / len(A | B)
-
-def entity_weighted_similarity(r1, r2):
-    pio_sim = jaccard(r1["PIOConcessions"], r2["PIOConcessions"])
-    mills_sim = jaccard(r1["Mills"], r2["Mills"])
-    supplier_sim = jaccard(r1["Suppliers"], r2["Suppliers"])
-
-    weighted = (
-        pio_sim * PIO_WEIGHT +
-        mills_sim * MILLS_WEIGHT +
-        supplier_sim * SUPPLIER_WEIGHT
-    )
-    return weighted
-
 def get_time_window(issue_group):
     if issue_group.lower().strip() == "environmental":
         return ENV_WINDOW
     else:
         return OTHER_WINDOW
 
-def time_in_window(d1, d2, issue_group):
-    window = get_time_window(issue_group)
-    return abs((d1 - d2).days) <= window
-
 def build_text(row):
     ent = " ".join(row["Suppliers"] + row["Mills"] + row["PIOConcessions"])
     return f"{row['Source']} | {row['Issues']} | {ent}"
 
-def ai_similarity(text1, text2):
-    emb = model.encode([text1, text2], normalize_embeddings=True)
-    return cosine_similarity([emb[0]], [emb[1]])[0][0]
-
 # ============================
-# PRECOMPUTE AI TEXT
+# PRECOMPUTE AI TEXT + EMBEDDINGS
 # ============================
 df["ai_text"] = df.apply(build_text, axis=1)
 
+# each unique text encoded once, cached on disk across runs. Override pairs
+# are scanned on the quantized copy and rescored on the float32 rows, read
+# from the memmap only where needed.
+cache = EmbeddingCache(MODEL_NAME)
+cache_rows = cache.rows(load_model, df["ai_text"].tolist())
+exact = RowView(cache.vectors(), cache_rows)
+if EMBEDDING_DTYPE == "float32":
+    embeddings, rescore = exact, None
+else:
+    embeddings, rescore = cache.quantized(EMBEDDING_DTYPE)[cache_rows], exact
+
+# ============================
+# ENTITY INCIDENCE (row = df row)
+# ============================
+# weighted Jaccard for a whole batch of pairs at once (incidence.weighted_jaccard)
+vocabs = new_vocabs(ENTITY_COLS)
+blocks = {
+    col: incidence_matrix(df[col].apply(vocabs[col].encode).tolist(), len(vocabs[col]))
+    for col in ENTITY_COLS
+}
+
 # ============================
 # MATCHING ENGINE
 # ============================
-used = set()
 clusters = []
 
 grouped = df.groupby("Issue_Category")
@@ -95,68 +101,85 @@ grouped = df.groupby("Issue_Category")
 for issue_group, group in grouped:
     group = group.sort_values("Date_Filed")
     idx_list = group.index.tolist()
+    rows = group.index.to_numpy()
+    days = day_numbers(group["Date_Filed"])   # NaN = no date
+    event_ids = group["Event_ID_S3"].to_numpy()
+    window = get_time_window(issue_group)
+    used = np.zeros(len(rows), dtype=bool)
+    # float32 rows in group (date) order: a base row's window is one slice
+    group_vectors = exact[rows]
+
+    # SOURCE OVERRIDE candidates in one batched pass: same Source, any date,
+    # similarity >= AI_OVERRIDE_THRESHOLD
+    override = similar_pairs_by_key(embeddings, idx_list, group["Source"], AI_OVERRIDE_THRESHOLD,
+                                    rescore=rescore)
+
+    ov_partners = later_partners(override, idx_list)
+
+    # in-window pairs (no date never passes), scored chunk by chunk
+    pair_i, pair_j, pair_score = [], [], []
+    for bi, bj in window_pairs(days, window):
+        ent_scores = weighted_jaccard(blocks, ENTITY_WEIGHTS, rows[bi], rows[bj])
+        # embeddings are normalized: cosine = dot product
+        ai_sims = band_dots(group_vectors, bi, bj).astype(float)
+        pair_i.append(bi)
+        pair_j.append(bj)
+        pair_score.append(0.7 * ent_scores + 0.3 * ai_sims)
+    if pair_i:
+        pair_i, pair_j, pair_score = map(np.concatenate, (pair_i, pair_j, pair_score))
+    else:
+        pair_i = pair_j = np.empty(0, dtype=np.int64)
+        pair_score = np.empty(0)
+    starts = base_slices(pair_i, len(rows))
 
-    for i, idx_i in enumerate(idx_list):
-        if idx_i in used:
+    for i in range(len(rows)):
+        if used[i]:
             continue
-
-        base = df.loc[idx_i]
-        cluster = [idx_i]
-        merge_with = None
+        idx_i = int(rows[i])
+
+        # =====================
+        # SOURCE OVERRIDE: later unused rows from the any-date query
+        # =====================
+        partners = ov_partners.get(i, np.empty(0, dtype=np.int64))
+        overridden = partners[~used[partners]]
+
+        # =====================
+        # TIME FILTER NORMAL: later unused rows inside the window
+        # =====================
+        cand = pair_j[starts[i]:starts[i + 1]]
+        final_scores = pair_score[starts[i]:starts[i + 1]]
+        keep = ~used[cand] & ~np.isin(cand, overridden)
+        cand, final_scores = cand[keep], final_scores[keep]
+
+        # best match = first highest positive score
         best_score = 0
-
-        for j in range(i+1, len(idx_list)):
-            idx_j = idx_list[j]
-            if idx_j in used:
-                continue
-
-            comp = df.loc[idx_j]
-
-            # =====================
-            # SOURCE OVERRIDE
-            # =====================
-            if base["Source"] == comp["Source"]:
-                ai_sim = ai_similarity(base["ai_text"], comp["ai_text"])
-                if ai_sim >= AI_OVERRIDE_THRESHOLD:
-                    cluster.append(idx_j)
-                    continue
-
-            # =====================
-            # TIME FILTER NORMAL
-            # =====================
-            if not time_in_window(base["Date_Filed"], comp["Date_Filed"], issue_group):
-                continue
-
-            # =====================
-            # ENTITY WEIGHTED SCORE
-            # =====================
-            ent_score = entity_weighted_similarity(base, comp)
-            ai_sim = ai_similarity(base["ai_text"], comp["ai_text"])
-
-            final_score = 0.7 * ent_score + 0.3 * ai_sim
-
-            if final_score > best_score:
-                best_score = final_score
-                merge_with = comp["Event_ID_S3"]
-
-            if final_score >= MERGE_THRESHOLD:
-                cluster.append(idx_j)
-
-        for idx in cluster:
-            used.add(idx)
-
-        if best_score >= MERGE_THRESHOLD:
-            level = f"MERGE {merge_with}"
-        elif best_score >= HIGH_THRESHOLD:
-            level = f"HIGH {merge_with}"
-        else:
-            level = f"LOW {merge_with}"
+        merge_with = None
+        if len(final_scores) and final_scores.max() > 0:
+            k = final_scores.argmax()
+            best_score = final_scores[k]
+            merge_with = event_ids[cand[k]]
+
+        # cluster keeps the group (date) order of overrides and merges
+        joined = np.zeros(len(rows), dtype=bool)
+        joined[overridden] = True
+        joined[cand[final_scores >= MERGE_THRESHOLD]] = True
+        used |= joined
+        used[i] = True
 
         clusters.append({
-            "cluster": cluster,
-            "match_level": level
+            "cluster": [idx_i] + rows[joined].tolist(),
+            "best_score": best_score,
+            "merge_with": merge_with
         })
 
+# Determine level for every cluster in one thresholding step
+best_scores = np.array([item["best_score"] for item in clusters], dtype=float)
+levels = np.select(
+    [best_scores >= MERGE_THRESHOLD, best_scores >= HIGH_THRESHOLD], ["MERGE", "HIGH"], "LOW"
+)
+for item, level in zip(clusters, levels.tolist()):
+    item["match_level"] = f"{level} {item['merge_with']}"
+
 # ============================
 # BUILD FINAL OUTPUT
 # ============================
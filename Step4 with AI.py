@@ -1,7 +1,15 @@
 import pandas as pd
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
+
+from ann_index import ann_pairs_by_key, recall
+from date_band import base_slices, later_partners, window_pairs
+from embedding_cache import EmbeddingCache
+from entity_index import ENTITY_COLS
+from incidence import incidence_matrix, weighted_jaccard
+from quantized_store import RowView
+from similarity import day_numbers, similar_pairs_by_key
+from stage_io import STEP3_FILE, read_stage
+from vocab import new_vocabs
 from collections import defaultdict
 
 # ============================
@@ -10,6 +18,8 @@ from collections import defaultdict
 SUPPLIER_WEIGHT = 0.30
 MILLS_WEIGHT = 0.35
 PIO_WEIGHT = 0.35
+# Jaccard per column, weighted and summed in this order
+ENTITY_WEIGHTS = {"Suppliers": SUPPLIER_WEIGHT, "Mills": MILLS_WEIGHT, "PIOConcessions": PIO_WEIGHT}
 
 MERGE_THRESHOLD = 0.70
 HIGH_THRESHOLD = 0.50
@@ -17,58 +27,42 @@ HIGH_THRESHOLD = 0.50
 ENV_TIME_WINDOW = 90
 OTHER_TIME_WINDOW = 60
 
-model = SentenceTransformer("all-MiniLM-L6-v2")
+FOLLOW_UP_THRESHOLD = 0.85
+USE_ANN = False           # LSH index per Source for FOLLOW_UP (ann_index.py); off: not faster than the tiles yet
+CHECK_ANN_RECALL = False  # also run the exact search and print the recall
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+EMBEDDING_DTYPE = "int8"   # similarity scans: int8 / float16 / float32 (exact)
+
+
+def load_model():
+    # imported here: torch / sentence-transformers only load when some text
+    # is not in the embedding cache yet
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(MODEL_NAME)
 
 # ============================
 # LOAD DATA
 # ============================
-df = pd.read_csv("Step3.csv", dtype=str)
+# Step 3 Parquet: list columns sudah list, Date_Filed sudah datetime
+df = read_stage(STEP3_FILE, columns=[
+    "Event_ID_S3", "Issue_Grouping", "Issues", "Suppliers", "Mills",
+    "PIOConcessions", "Grievance_List", "Source", "Date_Filed"
+])
 
-def to_list(cell):
-    if pd.isna(cell) or cell.strip() == "":
-        return []
-    return [x.strip() for x in str(cell).split(",") if x.strip()]
-
-for col in ["Suppliers", "Mills", "PIOConcessions", "Grievance_List"]:
-    df[col] = df[col].apply(to_list)
-
-df["Date_Filed"] = pd.to_datetime(df["Date_Filed"], errors="coerce")
-df["Issue_Grouping"] = df["Issue_Grouping"].astype(str)
-df["Issues"] = df["Issues"].astype(str)
-df["Source"] = df["Source"].astype(str)
-df["Event_ID_S3"] = df["Event_ID_S3"].astype(str)
+# Issues / Source tetap dipakai sebagai teks (ai_text, output)
+df["Issues"] = df["Issues"].str.join(", ")
+df["Source"] = df["Source"].str.join(", ")
 
 # ============================
 # FUNCTIONS
 # ============================
-def jaccard(a, b):
-    a, b = set(a), set(b)
-    if not a and not b:
-        return 0
-    return len(a & b) / len(a | b)
-
-def entity_similarity(r1, r2):
-    supplier_sim = jaccard(r1["Suppliers"], r2["Suppliers"])
-    mills_sim = jaccard(r1["Mills"], r2["Mills"])
-    pio_sim = jaccard(r1["PIOConcessions"], r2["PIOConcessions"])
-
-    weighted_score = (
-        supplier_sim * SUPPLIER_WEIGHT +
-        mills_sim * MILLS_WEIGHT +
-        pio_sim * PIO_WEIGHT
-    )
-
-    return weighted_score
-
 def get_time_window(issue_group):
     if "enviro" in issue_group.lower():
         return ENV_TIME_WINDOW
     else:
         return OTHER_TIME_WINDOW
 
-def time_diff_days(d1, d2):
-    return abs((d1 - d2).days)
-
 def build_text(row):
     return (
         f"{row['Source']} | "
@@ -82,89 +76,119 @@ def build_text(row):
 # EMBEDDINGS
 # ============================
 df["ai_text"] = df.apply(build_text, axis=1)
-embeddings = model.encode(df["ai_text"].tolist(), normalize_embeddings=True)
+# cached per text on disk: reruns only encode new / changed ai_text.
+# The search scans the quantized copy and rescores its hits on the float32
+# rows, read from the memmap only where needed.
+cache = EmbeddingCache(MODEL_NAME)
+cache_rows = cache.rows(load_model, df["ai_text"].tolist())
+exact = RowView(cache.vectors(), cache_rows)
+if EMBEDDING_DTYPE == "float32":
+    embeddings, rescore = exact, None
+else:
+    embeddings, rescore = cache.quantized(EMBEDDING_DTYPE)[cache_rows], exact
+
+# ============================
+# ENTITY INCIDENCE (row = df row)
+# ============================
+# weighted Jaccard for a whole batch of pairs at once (incidence.weighted_jaccard)
+vocabs = new_vocabs(ENTITY_COLS)
+blocks = {
+    col: incidence_matrix(df[col].apply(vocabs[col].encode).tolist(), len(vocabs[col]))
+    for col in ENTITY_COLS
+}
 
 # ============================
 # STEP 4 ENGINE
 # ============================
 merged_events = []
-used = set()
 mhid_counter = 1
 
 for group_name, group_df in df.groupby("Issue_Grouping"):
     group_df = group_df.sort_values("Date_Filed")
     indices = group_df.index.tolist()
+    rows = group_df.index.to_numpy()
+    days = day_numbers(group_df["Date_Filed"])   # NaN = no date
+    event_ids = group_df["Event_ID_S3"].to_numpy()
+    window = get_time_window(group_name)
+    used = np.zeros(len(rows), dtype=bool)
+
+    # FOLLOW UP candidates in one batched pass: same Source, outside the
+    # window, similarity > 0.85 (ANN index or tiles, not one pair at a time)
+    follow_up_args = dict(
+        E=embeddings, rows=indices, keys=group_df["Source"], threshold=FOLLOW_UP_THRESHOLD,
+        dates=group_df["Date_Filed"], min_gap=window, strict=True,
+        rescore=rescore
+    )
+    if USE_ANN:
+        follow_up = ann_pairs_by_key(**follow_up_args)
+        if CHECK_ANN_RECALL:
+            exact_pairs = similar_pairs_by_key(**follow_up_args)
+            print(f"FOLLOW_UP recall {group_name}: {recall(follow_up, exact_pairs):.3f} ({len(exact_pairs)} pairs)")
+    else:
+        follow_up = similar_pairs_by_key(**follow_up_args)
+
+    fu_partners = later_partners(follow_up, indices)
+
+    # in-window pairs (no date counts as in window), scored chunk by chunk
+    pair_i, pair_j, pair_score = [], [], []
+    for bi, bj in window_pairs(days, window, undated_in_window=True):
+        pair_i.append(bi)
+        pair_j.append(bj)
+        pair_score.append(weighted_jaccard(blocks, ENTITY_WEIGHTS, rows[bi], rows[bj]))
+    if pair_i:
+        pair_i, pair_j, pair_score = map(np.concatenate, (pair_i, pair_j, pair_score))
+    else:
+        pair_i = pair_j = np.empty(0, dtype=np.int64)
+        pair_score = np.empty(0)
+    starts = base_slices(pair_i, len(rows))
 
-    for i in range(len(indices)):
-        base_idx = indices[i]
-        if base_idx in used:
+    for i in range(len(rows)):
+        if used[i]:
             continue
-
-        base = df.loc[base_idx]
-        base_emb = embeddings[base_idx]
-        cluster = [base_idx]
-
+        base_idx = int(rows[i])
+
+        # FOLLOW UP logic: later unused rows from the out-of-window query
+        partners = fu_partners.get(i, np.empty(0, dtype=np.int64))
+        for comp_idx in rows[partners[~used[partners]]].tolist():
+            merged_events.append({
+                "base": base_idx,
+                "ref": comp_idx,
+                "level": "FOLLOW_UP"
+            })
+
+        # later unused rows inside the window
+        cand = pair_j[starts[i]:starts[i + 1]]
+        scores = pair_score[starts[i]:starts[i + 1]]
+        keep = ~used[cand]
+        cand, scores = cand[keep], scores[keep]
+        merged = cand[scores >= MERGE_THRESHOLD]
+
+        # best match = first highest non-zero score
         best_score = 0
         best_match = None
+        if len(scores) and scores.max() > 0:
+            k = scores.argmax()
+            best_score = scores[k]
+            best_match = event_ids[cand[k]]
 
-        for j in range(i + 1, len(indices)):
-            comp_idx = indices[j]
-            if comp_idx in used:
-                continue
-
-            comp = df.loc[comp_idx]
-
-            days = time_diff_days(base["Date_Filed"], comp["Date_Filed"])
-            window = get_time_window(base["Issue_Grouping"])
-
-            # FOLLOW UP logic
-            if base["Source"] == comp["Source"] and days > window:
-                sim = cosine_similarity(
-                    [base_emb],
-                    [embeddings[comp_idx]]
-                )[0][0]
-
-                if sim > 0.85:
-                    merged_events.append({
-                        "base": base_idx,
-                        "ref": comp_idx,
-                        "level": "FOLLOW_UP"
-                    })
-                continue
-
-            if days > window:
-                continue
-
-            ent_score = entity_similarity(base, comp)
-            if ent_score == 0:
-                continue
-
-            total_score = ent_score
-
-            if total_score > best_score:
-                best_score = total_score
-                best_match = comp["Event_ID_S3"]
-
-            if total_score >= MERGE_THRESHOLD:
-                cluster.append(comp_idx)
-
-        # Determine level
-        if best_score >= MERGE_THRESHOLD:
-            level = "MERGE"
-        elif best_score >= HIGH_THRESHOLD:
-            level = "HIGH"
-        else:
-            level = "LOW"
-
-        for idx in cluster:
-            used.add(idx)
+        used[i] = True
+        used[merged] = True
 
         merged_events.append({
-            "cluster": cluster,
-            "level": level,
+            "cluster": [base_idx] + rows[merged].tolist(),
+            "best_score": best_score,
             "merge_with": best_match
         })
 
+# Determine level for every cluster in one thresholding step
+clusters = [evt for evt in merged_events if "cluster" in evt]
+best_scores = np.array([evt["best_score"] for evt in clusters], dtype=float)
+levels = np.select(
+    [best_scores >= MERGE_THRESHOLD, best_scores >= HIGH_THRESHOLD], ["MERGE", "HIGH"], "LOW"
+)
+for evt, level in zip(clusters, levels.tolist()):
+    evt["level"] = level
+
 # ============================
 # BUILD OUTPUT
 # ============================
@@ -1,79 +1,19 @@
 #STEP 2 - Merge with the same Entity if same source
-df2 = df_expanded.copy()
-
-# Helper: unique sorted list
-def uniq_list(x):
-    return sorted(list(set(x)))
-
-events = []
-event_id = 1
+from events import merge_per_source
+from stage_io import STEP2_FILE, STEP2_LIST_COLS, STEP2_DATE_COLS, write_stage
+from vocab import decode_columns
 
 # ---- CLUSTER PER SOURCE ----
-for source, group in df2.groupby("Source"):
-    group = group.reset_index(drop=True)
-
-    source_events = []
-
-    for idx, row in group.iterrows():
-
-        # Ambil entitas
-        sup = set(row["Suppliers"])
-        mil = set(row["Mills"])
-        pio = set(row["PIOConcessions"])
-        iss = set(row["Issues"])
-
-        # IMPORTANT → Grievance ID asli!
-        gid = row["ID"]   # contoh: "Wilmar 1", "Bunge 2", dll
-
-        merged = False
-
-        # Cek overlap
-        for evt in source_events:
-
-            overlap = (
-                len(sup & set(evt["Suppliers"])) > 0 or
-                len(mil & set(evt["Mills"])) > 0 or
-                len(pio & set(evt["PIOConcessions"])) > 0
-            )
-
-            if overlap:
-                # Merge entitas
-                evt["Suppliers"] = uniq_list(list(set(evt["Suppliers"]) | sup))
-                evt["Mills"] = uniq_list(list(set(evt["Mills"]) | mil))
-                evt["PIOConcessions"] = uniq_list(list(set(evt["PIOConcessions"]) | pio))
-                evt["Issues"] = uniq_list(list(set(evt["Issues"]) | iss))
-
-                # Merge grievance
-                evt["Grievance_List"].append(gid)
-                evt["Grievance_List"] = uniq_list(evt["Grievance_List"])
-                evt["Grievance_Count"] = len(evt["Grievance_List"])
-
-                merged = True
-                break
-
-        # Tidak overlap → buat event baru
-        if not merged:
-            source_events.append({
-                "Event_ID": f"EVT_{event_id}",
-                "Source": source,
-                "Suppliers": uniq_list(list(sup)),
-                "Mills": uniq_list(list(mil)),
-                "PIOConcessions": uniq_list(list(pio)),
-                "Issues": uniq_list(list(iss)),
-                "Grievance_List": [gid],       # <── INI yang benar
-                "Grievance_Count": 1
-            })
-            event_id += 1
-
-    events.extend(source_events)
-
-# Convert ke DataFrame
-df_step2 = pd.DataFrame(events)
+# connected components lewat entitas yang sama (suppliers / mills / plots),
+# union_codes per event; Grievance_List = ID grievance asli
+df_step2 = merge_per_source(df_expanded)
+df_step2 = df_step2.drop(columns=["Date_Filed_List", "Date_Filed"])
 
-# List → string
-for col in ["Suppliers", "Mills", "PIOConcessions", "Issues", "Grievance_List"]:
-    df_step2[col] = df_step2[col].apply(lambda x: ", ".join(uniq_list(x)))
+# codes -> nama untuk Parquet
+decode_columns(df_step2, vocabs, ["Suppliers", "Mills", "PIOConcessions", "Issues"])
+df_step2["Source"] = df_step2["Source"].map(lambda c: vocabs["Source"].values[c])
 
+# List tetap list (list<string> di Parquet)
 df_step2.head(20)
-df_step2.to_csv('Step2.csv')
+write_stage(df_step2, STEP2_FILE, STEP2_LIST_COLS, STEP2_DATE_COLS)
 len(df_step2)
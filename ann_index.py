@@ -0,0 +1,173 @@
+# Approximate nearest-neighbour index for the AI FOLLOW_UP search.
+# Random-hyperplane LSH (SimHash) on NumPy: each of n_tables tables hashes a
+# normalized vector to n_bits signs. Multi-probe: rows in the same bucket or
+# in buckets one bit apart are candidates. Two vectors at cosine c differ in
+# one bit with q = arccos(c) / pi, so one table finds them with
+# p = (1 - q) ** n_bits + n_bits * q * (1 - q) ** (n_bits - 1) and all tables
+# miss them with (1 - p) ** n_tables. With the defaults (16 bits, 24 tables)
+# a pair at 0.85 is found ~99% of the time, while unrelated pairs (cosine ~0)
+# become candidates ~0.6% of the time.
+# Candidates are never collected as one global list: they are generated
+# bucket pair by bucket pair in chunks of about CHUNK_PAIRS, scored exactly
+# and thresholded, so memory stays at one chunk plus the hits.
+# recall() reports the hit rate against the exact tiled search (similarity.py).
+# E may be a QuantizedVectors; with rescore= (the float32 rows) the final
+# scores are exact, as in similar_pairs().
+
+import numpy as np
+import pandas as pd
+
+from quantized_store import as_float32
+from similarity import day_numbers, rescore_pairs, scan_threshold, similar_pairs
+
+N_TABLES = 24
+N_BITS = 16
+MIN_INDEX_SIZE = 256   # smaller partitions are searched exactly
+CHUNK_PAIRS = 1 << 20  # candidate pairs scored per chunk
+
+
+def _expand(a_start, a_len, b_start, b_len):
+    """positions (p, q) of every a x b pair of the given runs, run by run"""
+    sizes = a_len * b_len
+    run = np.repeat(np.arange(len(sizes)), sizes)
+    k = np.arange(int(sizes.sum()), dtype=np.int64) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    return a_start[run] + k // b_len[run], b_start[run] + k % b_len[run]
+
+
+class LSHIndex:
+    """Multi-probe SimHash tables over the rows of E (normalized vectors)"""
+
+    def __init__(self, E, n_tables=N_TABLES, n_bits=N_BITS, seed=0):
+        self.E = as_float32(E)
+        rng = np.random.default_rng(seed)
+        self.planes = rng.standard_normal((n_tables, n_bits, self.E.shape[1])).astype(np.float32)
+        self.n_bits = n_bits
+        self.weights = 1 << np.arange(n_bits, dtype=np.int64)
+        self.codes = self._codes(self.E)                      # n x n_tables
+        self.order = np.argsort(self.codes, axis=0, kind="stable")
+        self.sorted_codes = np.take_along_axis(self.codes, self.order, axis=0)
+
+    def _codes(self, X):
+        bits = np.einsum("tbd,nd->ntb", self.planes, X) > 0
+        return bits.astype(np.int64) @ self.weights
+
+    def _probes(self, code):
+        """code and every code one bit away"""
+        return np.r_[code, code ^ self.weights]
+
+    def query(self, x, threshold):
+        """Rows with cosine >= threshold to x (radius query), exact-rescored"""
+        code = self._codes(np.asarray(x, dtype=np.float32)[None, :])[0]
+        hits = []
+        for t in range(len(code)):
+            col = self.sorted_codes[:, t]
+            probes = self._probes(code[t])
+            lo, hi = np.searchsorted(col, probes, "left"), np.searchsorted(col, probes, "right")
+            hits.extend(self.order[l:h, t] for l, h in zip(lo, hi) if h > l)
+        if not hits:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        cand = np.unique(np.concatenate(hits))
+        sims = self.E[cand] @ x
+        keep = sims >= threshold
+        return cand[keep], sims[keep]
+
+    def _bucket_runs(self, t):
+        """(a_start, a_len, b_start, b_len, same) runs of sorted positions in
+        table t: every bucket with itself, and every bucket with each
+        neighbour one bit away (each unordered bucket pair once)"""
+        col = self.sorted_codes[:, t]
+        starts = np.flatnonzero(np.r_[True, col[1:] != col[:-1]])
+        lens = np.diff(np.r_[starts, len(col)])
+        codes = col[starts]
+
+        multi = lens > 1
+        runs = [(starts[multi], lens[multi], starts[multi], lens[multi], True)]
+        for w in self.weights:
+            nb = codes ^ w
+            pos = np.searchsorted(codes, nb)
+            pos[pos == len(codes)] = 0
+            ok = (codes[pos] == nb) & (nb > codes)
+            runs.append((starts[ok], lens[ok], starts[pos[ok]], lens[pos[ok]], False))
+        return runs
+
+    def candidate_chunks(self, chunk=CHUNK_PAIRS):
+        """Yield (i, j) row arrays of candidate pairs, about `chunk` at a time.
+        A pair can come up in several tables / probes; callers dedupe hits."""
+        for t in range(self.codes.shape[1]):
+            rows = self.order[:, t]
+            for a_start, a_len, b_start, b_len, same in self._bucket_runs(t):
+                sizes = a_len * b_len
+                cum = np.cumsum(sizes)
+                r = 0
+                while r < len(sizes):
+                    done = cum[r - 1] if r else 0
+                    e = max(r + 1, int(np.searchsorted(cum, done + chunk, side="right")))
+                    p, q = _expand(a_start[r:e], a_len[r:e], b_start[r:e], b_len[r:e])
+                    if same:
+                        keep = p < q
+                        p, q = p[keep], q[keep]
+                    i, j = rows[p], rows[q]
+                    yield np.minimum(i, j), np.maximum(i, j)
+                    r = e
+
+    def radius_pairs(self, threshold, strict=False, chunk=CHUNK_PAIRS):
+        """(i, j, sim) of candidate pairs whose exact cosine passes threshold,
+        scored chunk by chunk"""
+        n = len(self.E)
+        keys, sims = [], []
+        for i, j in self.candidate_chunks(chunk):
+            s = np.einsum("nd,nd->n", self.E[i], self.E[j])
+            keep = s > threshold if strict else s >= threshold
+            keys.append(i[keep] * n + j[keep])
+            sims.append(s[keep])
+        if not keys:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        flat, first = np.unique(np.concatenate(keys), return_index=True)
+        return flat // n, flat % n, np.concatenate(sims)[first]
+
+
+def ann_pairs_by_key(E, rows, keys, threshold, dates=None, min_gap=None, max_gap=None,
+                     strict=False, min_size=MIN_INDEX_SIZE, rescore=None, **index_kwargs):
+    """Same contract as similarity.similar_pairs_by_key, with an LSH index per
+    key for partitions of at least min_size rows"""
+    rows = np.asarray(rows)
+    keys = pd.Series(list(keys)).reset_index(drop=True)
+    date_values = None if dates is None else pd.Series(dates).reset_index(drop=True)
+    days = None if dates is None else day_numbers(date_values)
+    pairs = set()
+    for _, pos in keys.groupby(keys, sort=False).indices.items():
+        if len(pos) < 2:
+            continue
+        sub_rows = rows[pos]
+        sub_rescore = None if rescore is None else np.asarray(rescore[sub_rows])
+        if len(pos) < min_size:
+            i, j, _ = similar_pairs(
+                E[sub_rows], threshold, None if date_values is None else date_values.iloc[pos],
+                min_gap=min_gap, max_gap=max_gap, strict=strict, rescore=sub_rescore
+            )
+        else:
+            index = LSHIndex(E[sub_rows], **index_kwargs)
+            if sub_rescore is None:
+                i, j, _ = index.radius_pairs(threshold, strict)
+            else:
+                i, j, _ = index.radius_pairs(scan_threshold(E, threshold, sub_rescore), strict)
+                i, j, _ = rescore_pairs(i, j, sub_rescore, threshold, strict)
+            if days is not None:
+                d = days[pos]
+                gap = np.abs(d[i] - d[j])   # NaN (no date) fails both tests
+                keep = ~np.isnan(gap)
+                if min_gap is not None:
+                    keep &= gap > min_gap
+                if max_gap is not None:
+                    keep &= gap <= max_gap
+                i, j = i[keep], j[keep]
+        a, b = sub_rows[i], sub_rows[j]
+        pairs.update(zip(np.minimum(a, b).tolist(), np.maximum(a, b).tolist()))
+    return pairs
+
+
+def recall(approx, exact):
+    """Share of the exact pairs the approximate search found (1.0 if none)"""
+    if not exact:
+        return 1.0
+    return len(approx & exact) / len(exact)
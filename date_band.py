@@ -0,0 +1,93 @@
+# Date-band pair iterator for the Step 4 greedy passes.
+# Rows are sorted by date, so the rows within `window` days after row i are one
+# contiguous run [i + 1, end_i) with end_i from np.searchsorted: the pairs come
+# out in row order, chunk by chunk, and nothing past the band is ever looked
+# at. Same-Source FOLLOW_UP / override candidates (outside the window or at
+# any date) come from their own similarity query and are looked up per base
+# row with later_partners().
+
+import numpy as np
+
+CHUNK = 65536   # roughly this many pairs per chunk (whole base rows)
+
+
+def _expand(base, start, stop):
+    """(i, j) arrays: base[k] paired with every j in start[k]:stop[k], in order"""
+    lengths = stop - start
+    total = int(lengths.sum())
+    i = np.repeat(base, lengths)
+    offset = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    j = np.arange(total, dtype=np.int64) - offset + np.repeat(start, lengths)
+    return i, j
+
+
+def window_pairs(days, window, undated_in_window=False, chunk=CHUNK):
+    """Yield (i, j) int64 position arrays, i < j, with days[j] - days[i] <= window,
+    sorted by i then j. days: float day numbers sorted ascending with the NaN
+    (no date) rows last. undated_in_window: pairs with an undated row count as
+    inside the window (otherwise they never pair)."""
+    days = np.asarray(days, dtype=float)
+    n = len(days)
+    m = n - int(np.isnan(days).sum())          # dated rows: 0..m-1
+    if np.isnan(days[:m]).any():
+        raise ValueError("days must be sorted with the NaN rows last")
+
+    rows = np.arange(n, dtype=np.int64)
+    # segment 1: the date band; segment 2: the undated rows (if they pair)
+    start1 = rows + 1
+    stop1 = np.empty(n, dtype=np.int64)
+    stop1[:m] = np.searchsorted(days[:m], days[:m] + window, side="right")
+    stop1[m:] = n if undated_in_window else start1[m:]
+    start2 = np.full(n, m, dtype=np.int64)
+    stop2 = np.full(n, n if undated_in_window else m, dtype=np.int64)
+    start2[m:] = stop2[m:] = n                 # undated bases: all in segment 1
+    stop1 = np.maximum(stop1, start1)
+
+    counts = (stop1 - start1) + (stop2 - start2)
+    cum = np.cumsum(counts)
+    a = 0
+    while a < n:
+        done = cum[a - 1] if a else 0
+        b = max(a + 1, int(np.searchsorted(cum, done + chunk, side="right")))
+        b = min(b, n)
+        if cum[b - 1] > done:
+            base = np.concatenate([rows[a:b], rows[a:b]])
+            i, j = _expand(base, np.concatenate([start1[a:b], start2[a:b]]),
+                           np.concatenate([stop1[a:b], stop2[a:b]]))
+            order = np.lexsort((j, i))
+            yield i[order], j[order]
+        a = b
+
+
+def band_dots(vectors, i, j):
+    """vectors[i] . vectors[j] for window_pairs() output, without gathering two
+    rows per pair: each base row is scored against its band of later rows with
+    one matrix-vector product (the band is a contiguous slice of vectors when
+    undated rows do not pair; otherwise its rows are gathered)."""
+    out = np.empty(len(i), dtype=np.float32)
+    bases, starts = np.unique(i, return_index=True)
+    stops = np.append(starts[1:], len(i))
+    for r, s, e in zip(bases, starts, stops):
+        if j[e - 1] - j[s] == e - s - 1:
+            band = vectors[j[s]:j[e - 1] + 1]
+        else:
+            band = vectors[j[s:e]]
+        out[s:e] = band @ vectors[r]
+    return out
+
+
+def base_slices(i, n):
+    """For pair arrays sorted by i: starts such that the pairs of base row r
+    are starts[r]:starts[r + 1]"""
+    return np.searchsorted(i, np.arange(n + 1), side="left")
+
+
+def later_partners(pairs, rows):
+    """{(row_a, row_b)} label pairs -> {position: sorted array of later positions}
+    (positions in `rows`, the date-sorted group order)"""
+    pos_of = {r: p for p, r in enumerate(rows)}
+    out = {}
+    for a, b in pairs:
+        pa, pb = pos_of[a], pos_of[b]
+        out.setdefault(min(pa, pb), []).append(max(pa, pb))
+    return {p: np.array(sorted(js), dtype=np.int64) for p, js in out.items()}
@@ -0,0 +1,165 @@
+# On-disk embedding cache for the AI Step 4 scripts.
+# Every build_text() string is keyed by a content hash (model name + text) and
+# encoded once; vectors live in a float32 file read back through np.memmap,
+# the hashes in an index file with one line per vector row. Reruns only
+# encode the texts that are new or changed. quantized() adds an int8 / float16
+# copy of the rows (quantized_store.py) for the similarity kernels; the
+# float32 file stays the exact reference.
+#
+#   embedding_cache/<model>/vectors.f32   n x dim float32, row i = i-th sha1 in index.txt
+#   embedding_cache/<model>/index.txt     "dim <d>", then one sha1 per row
+#   embedding_cache/<model>/vectors.i8 + scales.f32, vectors.f16   quantized copies
+#   embedding_cache/<model>/vectors.i8.meta, vectors.f16.meta       "rows <n>", "sha1 <h>":
+#       the quantized copy holds the first n cache rows, h fingerprints their keys
+
+import hashlib
+import os
+
+import numpy as np
+
+from quantized_store import DTYPES, QuantizedVectors, quantize
+
+CACHE_DIR = "embedding_cache"
+
+QUANT_FILES = {"int8": ("vectors.i8", "scales.f32"), "float16": ("vectors.f16", None)}
+
+
+def text_key(model_name, text):
+    return hashlib.sha1(f"{model_name}\n{text}".encode("utf-8")).hexdigest()
+
+
+def keys_sha1(dim, keys):
+    """fingerprint of the first len(keys) cache rows"""
+    h = hashlib.sha1(f"dim {dim}\n".encode())
+    for k in keys:
+        h.update(k.encode() + b"\n")
+    return h.hexdigest()
+
+
+def _read_meta(path):
+    """(rows, sha1) from a quantized copy's .meta file, (0, None) if missing"""
+    if not os.path.exists(path):
+        return 0, None
+    with open(path) as f:
+        meta = dict(line.split(" ", 1) for line in f.read().splitlines() if " " in line)
+    return int(meta.get("rows", 0)), meta.get("sha1")
+
+
+def _write_meta(path, rows, sha1):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(f"rows {rows}\nsha1 {sha1}\n")
+    os.replace(tmp, path)
+
+
+class EmbeddingCache:
+    """Append-only store of normalized embeddings for one model"""
+
+    def __init__(self, model_name, cache_dir=CACHE_DIR):
+        self.model_name = model_name
+        self.dir = os.path.join(cache_dir, model_name.replace("/", "__"))
+        self.vectors_path = os.path.join(self.dir, "vectors.f32")
+        self.index_path = os.path.join(self.dir, "index.txt")
+        os.makedirs(self.dir, exist_ok=True)
+
+        self.row_of = {}
+        self.dim = None
+        self._vectors = None
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                lines = f.read().split("\n")
+            self.dim = int(lines[0].split()[1])
+            keys = [k for k in lines[1:] if k]
+            self.row_of = {k: i for i, k in enumerate(keys)}
+            # drop rows an interrupted run wrote without indexing them
+            with open(self.vectors_path, "a+b") as f:
+                f.truncate(len(keys) * self.dim * 4)
+
+    def __len__(self):
+        return len(self.row_of)
+
+    def vectors(self):
+        """memmap of all cached rows (None while the cache is empty)"""
+        if self._vectors is None and self.row_of:
+            self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r",
+                                      shape=(len(self.row_of), self.dim))
+        return self._vectors
+
+    def quantized(self, dtype="int8"):
+        """QuantizedVectors over all cached rows, memmapped. Rows added since
+        the last call are quantized from the float32 file first; if the
+        copy's .meta does not match the cache keys, it is redone from row 0."""
+        if not self.row_of:
+            return None
+        data_file, scale_file = QUANT_FILES[dtype]
+        data_path = os.path.join(self.dir, data_file)
+        scale_path = scale_file and os.path.join(self.dir, scale_file)
+        row_bytes = self.dim * np.dtype(DTYPES[dtype]).itemsize
+
+        meta_path = data_path + ".meta"
+        keys = list(self.row_of)
+
+        # rows already quantized: recorded in .meta for the same keys, and
+        # present in both files
+        done, sha1 = _read_meta(meta_path)
+        if done > len(self) or sha1 != keys_sha1(self.dim, keys[:done]):
+            done = 0
+        done = min(done, os.path.getsize(data_path) // row_bytes if os.path.exists(data_path) else 0)
+        if scale_path:
+            done = min(done, os.path.getsize(scale_path) // 4 if os.path.exists(scale_path) else 0)
+        if done < len(self):
+            data, scales = quantize(self.vectors()[done:], dtype)
+            with open(data_path, "a+b") as f:
+                f.truncate(done * row_bytes)
+                f.write(data.tobytes())
+            if scale_path:
+                with open(scale_path, "a+b") as f:
+                    f.truncate(done * 4)
+                    f.write(scales.tobytes())
+            # after the data: an interrupted run leaves .meta at the old rows
+            _write_meta(meta_path, len(self), keys_sha1(self.dim, keys))
+
+        n = len(self)
+        data = np.memmap(data_path, dtype=DTYPES[dtype], mode="r", shape=(n, self.dim))
+        scales = np.memmap(scale_path, dtype=np.float32, mode="r", shape=(n,)) if scale_path else None
+        return QuantizedVectors(data, scales)
+
+    def _append(self, keys, embeddings):
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if self.dim is None:
+            self.dim = embeddings.shape[1]
+            with open(self.index_path, "w") as f:
+                f.write(f"dim {self.dim}\n")
+        # vectors first: an interrupted run leaves extra rows, never a short file
+        with open(self.vectors_path, "ab") as f:
+            f.write(embeddings.tobytes())
+        with open(self.index_path, "a") as f:
+            f.writelines(k + "\n" for k in keys)
+        for k in keys:
+            self.row_of[k] = len(self.row_of)
+        self._vectors = None
+
+    def rows(self, model, texts, batch_size=64):
+        """Cache row of each text (int array, in order); only texts not in the
+        cache go through model.encode, each once. model may also be a function
+        returning the model: it is only called if some text is missing."""
+        keys = [text_key(self.model_name, t) for t in texts]
+        missing = {}
+        for k, t in zip(keys, texts):
+            if k not in self.row_of and k not in missing:
+                missing[k] = t
+        if missing:
+            if not hasattr(model, "encode"):
+                model = model()
+            new = model.encode(list(missing.values()), batch_size=batch_size,
+                               normalize_embeddings=True)
+            self._append(list(missing), new)
+        return np.array([self.row_of[k] for k in keys], dtype=np.int64)
+
+    def encode(self, model, texts, batch_size=64):
+        """Embeddings (len(texts) x dim, normalized, float32) for texts in order"""
+        rows = self.rows(model, texts, batch_size)
+        vectors = self.vectors()
+        if vectors is None:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.asarray(vectors[rows])
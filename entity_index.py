@@ -0,0 +1,124 @@
+# Entity -> event posting index for the per-source clustering (Step 2).
+# Instead of rebuilding set(evt["Suppliers"]) etc. for every event on every row,
+# each supplier / mill / plot ID points to the events that already contain it.
+
+from collections import defaultdict, deque
+
+import pandas as pd
+
+ENTITY_COLS = ["Suppliers", "Mills", "PIOConcessions"]
+
+
+def new_index(cols=ENTITY_COLS):
+    """Empty posting index: {column: {entity: set(event positions)}}"""
+    return {col: defaultdict(set) for col in cols}
+
+
+def add_to_index(index, evt_pos, entities):
+    """Register evt_pos under every entity; entities = {column: iterable of IDs}"""
+    for col, values in entities.items():
+        postings = index[col]
+        for v in values:
+            postings[v].add(evt_pos)
+
+
+def remove_from_index(index, evt_pos, entities):
+    """Drop evt_pos from the postings of its entities (empty postings removed)"""
+    for col, values in entities.items():
+        postings = index[col]
+        for v in values:
+            members = postings.get(v)
+            if members is None:
+                continue
+            members.discard(evt_pos)
+            if not members:
+                del postings[v]
+
+
+def candidate_events(index, entities):
+    """All event positions sharing at least one entity with the row"""
+    hits = set()
+    for col, values in entities.items():
+        hits |= postings_hits(index, col, values)
+    return hits
+
+
+# Step 3 (cross-source) candidates: postings per column, combined by rule
+def postings_hits(index, col, values):
+    """Union of the posting lists of values in one column"""
+    postings = index[col]
+    hits = set()
+    for v in values:
+        if v in postings:
+            hits |= postings[v]
+    return hits
+
+
+def has_infra(entities):
+    return len(entities["Mills"]) > 0 or len(entities["PIOConcessions"]) > 0
+
+
+def step3_candidates(index, entities, no_infra=None):
+    """Events satisfying the "1 supplier AND 1 mill/plot" rule with the row:
+    supplier postings intersected with the union of mill and plot postings.
+
+    no_infra: positions of indexed events without any mill/plot. When given,
+    the relaxed rule applies (if either side has no infra, a shared supplier
+    is enough)."""
+    sup_hits = postings_hits(index, "Suppliers", entities["Suppliers"])
+    if not sup_hits:
+        return sup_hits
+    if no_infra is not None and not has_infra(entities):
+        return sup_hits
+
+    infra_hits = (
+        postings_hits(index, "Mills", entities["Mills"]) |
+        postings_hits(index, "PIOConcessions", entities["PIOConcessions"])
+    )
+    out = sup_hits & infra_hits
+    if no_infra is not None:
+        out |= sup_hits & no_infra
+    return out
+
+
+def step3_pairs(rows, relaxed=False):
+    """All (i, j), i < j, of rows ({column: set}) that satisfy the Step 3 rule,
+    using the posting index instead of comparing every pair."""
+    index = new_index()
+    no_infra = set() if relaxed else None
+    pairs = []
+    for j, entities in enumerate(rows):
+        for i in step3_candidates(index, entities, no_infra):
+            pairs.append((i, j))
+        add_to_index(index, j, entities)
+        if relaxed and not has_infra(entities):
+            no_infra.add(j)
+    return pairs
+
+
+def step3_window_pairs(rows, dates, window_days, relaxed=False):
+    """Same pairs as step3_pairs() restricted to |date_i - date_j| <= window_days,
+    found with a date-sorted sweep: only rows inside the active window are in
+    the posting index, older ones are evicted as the sweep advances.
+    Rows without a date never pair (same as time_overlap)."""
+    order = sorted(
+        (i for i in range(len(rows)) if not pd.isna(dates[i])),
+        key=lambda i: dates[i]
+    )
+    index = new_index()
+    no_infra = set() if relaxed else None
+    active = deque()
+    pairs = []
+    for j in order:
+        while active and (dates[j] - dates[active[0]]).days > window_days:
+            i = active.popleft()
+            remove_from_index(index, i, rows[i])
+            if relaxed:
+                no_infra.discard(i)
+        for i in step3_candidates(index, rows[j], no_infra):
+            pairs.append((min(i, j), max(i, j)))
+        add_to_index(index, j, rows[j])
+        if relaxed and not has_infra(rows[j]):
+            no_infra.add(j)
+        active.append(j)
+    return pairs
@@ -0,0 +1,43 @@
+# Step 2 event building shared by the merge scripts and the sweep tools:
+# per Source, grievance rows sharing a supplier / mill / plot become one event.
+
+import pandas as pd
+
+from entity_index import ENTITY_COLS
+from union_find import cluster_entities, group_members
+from vocab import union_codes
+
+
+def uniq_list(x):
+    return sorted(list(set(x)))
+
+
+def merge_per_source(df_expanded):
+    """Expanded Step 1 rows (code-array columns, Source code) -> one row per
+    Step 2 event, numbered EVT_1.. in Source order"""
+    events = []
+
+    for source, group in df_expanded.groupby("Source"):
+        # connected components over shared suppliers / mills / plots
+        labels = cluster_entities(
+            group[ENTITY_COLS].to_dict("records"), ENTITY_COLS
+        )
+
+        for members in group_members(labels):
+            sub = group.iloc[members]
+            grievances = uniq_list(sub["ID"])
+
+            events.append({
+                "Event_ID": f"EVT_{len(events) + 1}",
+                "Source": source,
+                "Suppliers": union_codes(sub["Suppliers"]),
+                "Mills": union_codes(sub["Mills"]),
+                "PIOConcessions": union_codes(sub["PIOConcessions"]),
+                "Issues": union_codes(sub["Issues"]),
+                "Grievance_List": grievances,
+                "Grievance_Count": len(grievances),
+                "Date_Filed_List": uniq_list(sub["Date Filed"]),
+                "Date_Filed": sub["Date Filed"].min()
+            })
+
+    return pd.DataFrame(events)
@@ -0,0 +1,148 @@
+# Cached plot centroids and mill coordinates for the proximity steps.
+# Reading plots_v2_*.gpkg, reprojecting every polygon to EPSG:3857 and taking
+# centroids, or parsing the mill Latitude / Longitude / GPS strings, happens
+# once per version of the source file; the result is a small Parquet table in
+# geo_cache/ that later runs read without geopandas or the GPKG.
+#
+#   plots: ID -> lon, lat (centroid, EPSG:4326), x, y (centroid, EPSG:3857),
+#          minx, miny, maxx, maxy (bbox, EPSG:3857)
+#   mills: ID -> lon, lat, x, y
+#
+# A cache is current while the source's mtime + size match the ones stored in
+# the Parquet metadata; if only the mtime moved, the sha1 decides (and the
+# stored mtime is refreshed), so a copy or touch does not force a rebuild.
+
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+CACHE_DIR = "geo_cache"
+
+# mill ID column, first one present wins (same order as the grouping notebook)
+MILL_ID_COLS = ["Mill ID", "ID", "Name", "UML_ID"]
+
+
+def file_sha1(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _cache_path(source, kind, cache_dir):
+    return os.path.join(cache_dir, f"{os.path.basename(source)}.{kind}.parquet")
+
+
+def _write(df, path, source, sha1):
+    st = os.stat(source)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    meta = dict(table.schema.metadata or {})
+    meta.update({
+        b"source_sha1": sha1.encode(),
+        b"source_mtime_ns": str(st.st_mtime_ns).encode(),
+        b"source_size": str(st.st_size).encode(),
+    })
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    pq.write_table(table.replace_schema_metadata(meta), tmp)
+    os.replace(tmp, path)   # readers never see a half-written cache
+
+
+def _cached(source, kind, build, cache_dir):
+    """Cache table for source, rebuilt with build(source) when the file changed"""
+    path = _cache_path(source, kind, cache_dir)
+    st = os.stat(source)
+    if os.path.exists(path):
+        meta = pq.read_schema(path).metadata or {}
+        if (meta.get(b"source_mtime_ns") == str(st.st_mtime_ns).encode()
+                and meta.get(b"source_size") == str(st.st_size).encode()):
+            return pd.read_parquet(path)
+        sha1 = file_sha1(source)
+        if meta.get(b"source_sha1") == sha1.encode():
+            df = pd.read_parquet(path)
+            _write(df, path, source, sha1)
+            return df
+    else:
+        sha1 = file_sha1(source)
+    df = build(source)
+    _write(df, path, source, sha1)
+    return df
+
+
+# =====================================================
+# BUILDERS (only these touch geopandas)
+# =====================================================
+def _build_plots(gpkg_path, id_col="ID"):
+    import geopandas as gpd
+
+    gdf = gpd.read_file(gpkg_path)[[id_col, "geometry"]]
+    gdf = gdf.to_crs(3857)
+    cent = gdf.geometry.centroid
+    lonlat = cent.to_crs(4326)
+    bounds = gdf.geometry.bounds
+    return pd.DataFrame({
+        "ID": gdf[id_col].astype(str).to_numpy(),
+        "lon": lonlat.x.to_numpy(), "lat": lonlat.y.to_numpy(),
+        "x": cent.x.to_numpy(), "y": cent.y.to_numpy(),
+        "minx": bounds["minx"].to_numpy(), "miny": bounds["miny"].to_numpy(),
+        "maxx": bounds["maxx"].to_numpy(), "maxy": bounds["maxy"].to_numpy(),
+    })
+
+
+def parse_mill_lonlat(mills):
+    """(lon, lat) float arrays for a Mills export read as str with fillna("").
+    Latitude + Longitude when both are filled, else GPS "lat, lon"; NaN when
+    the row has neither or they do not parse (same rule as parse_mill_coords)."""
+    def num(s):
+        return pd.to_numeric(s.str.strip(), errors="coerce").to_numpy(dtype=float)
+
+    n = len(mills)
+    empty = pd.Series([""] * n, index=mills.index)
+    lat_s = mills.get("Latitude", empty)
+    lon_s = mills.get("Longitude", empty)
+    gps = mills.get("GPS", empty).str.split(",")
+
+    use_ll = ((lat_s != "") & (lon_s != "")).to_numpy()
+    use_gps = ~use_ll & (mills.get("GPS", empty) != "").to_numpy() & (gps.str.len() == 2).to_numpy()
+
+    lat = np.full(n, np.nan)
+    lon = np.full(n, np.nan)
+    lat[use_ll], lon[use_ll] = num(lat_s[use_ll]), num(lon_s[use_ll])
+    lat[use_gps], lon[use_gps] = num(gps[use_gps].str[0]), num(gps[use_gps].str[1])
+    bad = np.isnan(lat) | np.isnan(lon)
+    lat[bad] = lon[bad] = np.nan
+    return lon, lat
+
+
+def _build_mills(mills_path):
+    import geopandas as gpd
+
+    mills = pd.read_csv(mills_path, dtype=str).fillna("")
+    id_col = next((c for c in MILL_ID_COLS if c in mills.columns), None)
+    lon, lat = parse_mill_lonlat(mills)
+    ok = ~np.isnan(lon)
+    pts = gpd.GeoSeries(gpd.points_from_xy(lon[ok], lat[ok]), crs="EPSG:4326").to_crs(3857)
+    ids = mills[id_col].astype(str).to_numpy()[ok] if id_col else np.arange(ok.sum()).astype(str)
+    return pd.DataFrame({
+        "ID": ids, "lon": lon[ok], "lat": lat[ok],
+        "x": pts.x.to_numpy(), "y": pts.y.to_numpy(),
+    })
+
+
+# =====================================================
+# PUBLIC
+# =====================================================
+def plot_centroids(gpkg_path, cache_dir=CACHE_DIR):
+    """ID, lon, lat, x, y, minx, miny, maxx, maxy per plot feature (x / y /
+    bbox in EPSG:3857 metres; NaN for features without a geometry)"""
+    return _cached(gpkg_path, "plots", _build_plots, cache_dir)
+
+
+def mill_coords(mills_path, cache_dir=CACHE_DIR):
+    """ID, lon, lat, x, y per mill with usable coordinates"""
+    return _cached(mills_path, "mills", _build_mills, cache_dir)
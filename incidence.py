@@ -0,0 +1,123 @@
+# Sparse incidence matrix (rows x interned entities) pair generator.
+# One CSR block per entity kind; A @ A.T gives every pair of rows sharing at
+# least one entity of that kind together with the shared count, so the Step 3
+# "1 supplier AND 1 mill/plot" rule is an elementwise AND of sparse matrices
+# instead of a Python double loop.
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from entity_index import ENTITY_COLS
+from union_find import cluster_pairs, group_members
+from vocab import union_codes
+
+
+def incidence_matrix(codes, n_entities):
+    """codes = one sorted unique int array per row -> CSR rows x n_entities,
+    1 where the row has the entity"""
+    lengths = np.fromiter((len(c) for c in codes), dtype=np.int64, count=len(codes))
+    indptr = np.zeros(len(codes) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=indptr[1:])
+    indices = np.concatenate(codes).astype(np.int32) if indptr[-1] else np.empty(0, dtype=np.int32)
+    data = np.ones(len(indices), dtype=np.int32)
+    return sp.csr_matrix((data, indices, indptr), shape=(len(codes), n_entities))
+
+
+def entity_blocks(df, vocabs, cols=ENTITY_COLS):
+    """{column: incidence matrix} for code-array columns of df"""
+    return {col: incidence_matrix(df[col].tolist(), len(vocabs[col])) for col in cols}
+
+
+def overlap_counts(A):
+    """Shared-entity counts for every pair i < j (upper triangle of A @ A.T)"""
+    return sp.triu(A @ A.T, k=1, format="csr")
+
+
+def overlap_pairs(A):
+    """(i, j, shared) arrays for every pair i < j sharing at least one entity"""
+    C = overlap_counts(A).tocoo()
+    return C.row, C.col, C.data
+
+
+def step3_edges(blocks, relaxed=False):
+    """Same pairs as entity_index.step3_pairs(): supplier overlap AND
+    (mill OR plot overlap). relaxed: if either side has no mill/plot, a shared
+    supplier is enough."""
+    sup = overlap_counts(blocks["Suppliers"])
+    infra = overlap_counts(blocks["Mills"]) + overlap_counts(blocks["PIOConcessions"])
+    rule = sup.multiply(infra > 0).tocoo()
+    rows, cols = rule.row, rule.col
+
+    if relaxed:
+        no_infra = (blocks["Mills"].getnnz(axis=1) + blocks["PIOConcessions"].getnnz(axis=1)) == 0
+        s = sup.tocoo()
+        keep = no_infra[s.row] | no_infra[s.col]
+        rows = np.concatenate([rows, s.row[keep]])
+        cols = np.concatenate([cols, s.col[keep]])
+
+    return list(zip(rows.tolist(), cols.tolist()))
+
+
+def _min_day_gaps(days, a, b):
+    """Smallest |day_x - day_y| between the sorted day arrays days[a[k]] and
+    days[b[k]] for every k (inf if either side has no date)"""
+    out = np.full(len(a), np.inf)
+    for k, (x, y) in enumerate(zip(a, b)):
+        dx, dy = days[x], days[y]
+        if len(dx) and len(dy):
+            pos = np.clip(np.searchsorted(dy, dx), 1, len(dy)) - 1
+            near = np.minimum(np.abs(dx - dy[pos]), np.abs(dx - dy[np.minimum(pos + 1, len(dy) - 1)]))
+            out[k] = near.min()
+    return out
+
+
+def step3_fixpoint(df, vocabs, labels, relaxed=False, dates=None, window_days=None):
+    """Grow Step 3 clusters until no two of them satisfy the rule on their
+    accumulated entity sets, as the old loop compared each event against the
+    merged event (a supplier from one member and a mill from another count).
+    labels: cluster label per row of df (cluster_pairs over the row edges).
+    With dates / window_days two clusters must also have member dates at most
+    window_days apart. Returns the final label per row (numbered by first row)."""
+    labels = np.asarray(labels)
+    days = None
+    if dates is not None:
+        d = pd.to_datetime(pd.Series(list(dates))).to_numpy().astype("datetime64[D]")
+        days = np.where(np.isnat(d), np.nan, d.astype(np.int64).astype(float))
+    while True:
+        groups = group_members(labels)
+        if len(groups) < 2:
+            return labels
+        blocks = {
+            col: incidence_matrix([union_codes(df[col].iloc[g]) for g in groups], len(vocabs[col]))
+            for col in ENTITY_COLS
+        }
+        pairs = step3_edges(blocks, relaxed)
+        if days is not None and pairs:
+            group_days = [np.sort(days[g][~np.isnan(days[g])]) for g in groups]
+            a, b = np.array(pairs).T
+            keep = _min_day_gaps(group_days, a, b) <= window_days
+            pairs = [p for p, k in zip(pairs, keep) if k]
+        if not pairs:
+            return labels
+        labels = np.asarray(cluster_pairs(len(groups), pairs))[labels]
+
+
+def pair_jaccard(A, i, j):
+    """Jaccard of rows i[k], j[k] of incidence matrix A for every k (0 when both
+    rows are empty): intersections from the row-wise product, unions from the
+    row nnz"""
+    i, j = np.asarray(i, dtype=np.int64), np.asarray(j, dtype=np.int64)
+    inter = np.asarray(A[i].multiply(A[j]).sum(axis=1)).ravel().astype(float)
+    nnz = A.getnnz(axis=1)
+    union = nnz[i] + nnz[j] - inter
+    return np.divide(inter, union, out=np.zeros(len(i)), where=union > 0)
+
+
+def weighted_jaccard(blocks, weights, i, j):
+    """sum of weight * pair_jaccard over {column: weight}, added in the order
+    given (same float result as the scalar formula written in that order)"""
+    score = np.zeros(len(i))
+    for col, w in weights.items():
+        score += pair_jaccard(blocks[col], i, j) * w
+    return score
@@ -0,0 +1,226 @@
+# Incremental Step 1-3 state for the no-time-window merge (RG-Notw.py rules).
+# Between runs the state keeps the expanded grievance rows, the Step 2 events,
+# the event posting index and the event -> MHID assignment. A new export is
+# diffed against it by ID + Last Modified; only the Sources and MHIDs the new /
+# changed / deleted grievances touch are recomputed. The state lives in SQLite
+# (state_store.py).
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from entity_index import ENTITY_COLS, new_index, add_to_index, remove_from_index, postings_hits, step3_pairs
+from incidence import step3_fixpoint
+from events import merge_per_source, uniq_list
+from loader import ENTITY_LIST_COLS, SOURCE_SPLIT_NOTW, split_entities, expand_sources
+from union_find import cluster_pairs, group_members
+from vocab import VOCAB_COLS, new_vocabs, union_codes
+import state_store
+
+STATE_FILE = "merge_state.sqlite"
+
+TRACKER_COLS = ["Company Tracker", "Tracker Company AirtableRecIDs"]
+
+
+def new_state():
+    return {
+        "vocabs": new_vocabs(VOCAB_COLS + ["PIOConcessions-v2"]),
+        "versions": {},       # ID -> Last Modified of its export rows
+        "tracker": {},        # ID -> {Company Tracker, Tracker Company AirtableRecIDs}
+        "rows": None,         # expanded Step 1 rows (code arrays, Source code)
+        "events": {},         # Event_ID -> Step 2 event
+        "event_index": new_index(),
+        "mhid_of": {},        # Event_ID -> MHID
+        "mhids": {},          # MHID -> Step 3 row (code arrays)
+        "next_event": 1,
+        "next_mhid": 1,
+        "dirty": None,        # what save_state() rewrites (None: everything)
+    }
+
+
+def load_state(path=STATE_FILE):
+    if not os.path.exists(path):
+        return new_state()
+    return state_store.load(path, _mhid_row)
+
+
+def save_state(state, path=STATE_FILE):
+    state_store.save(state, path)
+
+
+def _versions(export):
+    """ID -> Last Modified as str; IDs on several rows join their sorted values"""
+    lm = export["Last Modified"].astype(str)
+    dup = export["ID"].duplicated(keep=False)
+    versions = dict(zip(export["ID"][~dup], lm[~dup]))
+    for gid, values in lm[dup].groupby(export["ID"][dup]):
+        versions[gid] = "|".join(sorted(values))
+    return versions
+
+
+def diff_export(state, export):
+    """(new IDs, changed IDs, deleted IDs) of export vs the state"""
+    versions = _versions(export)
+    old = state["versions"]
+    new = {g for g in versions if g not in old}
+    changed = {g for g in versions if g in old and versions[g] != old[g]}
+    deleted = {g for g in old if g not in versions}
+    return new, changed, deleted, versions
+
+
+def _event_entities(evt):
+    return {col: evt[col] for col in ENTITY_COLS}
+
+
+def _mhid_row(mhid, members, events):
+    sub = [events[e] for e in members]
+    grievances = uniq_list(sum((e["Grievance_List"] for e in sub), []))
+    return {
+        "MHID": mhid,
+        "Suppliers": union_codes(e["Suppliers"] for e in sub),
+        "Mills": union_codes(e["Mills"] for e in sub),
+        "PIOConcessions": union_codes(e["PIOConcessions"] for e in sub),
+        "Issues": union_codes(e["Issues"] for e in sub),
+        "Source": union_codes(e["Source"] for e in sub),
+        "Grievance_List": grievances,
+        "Grievance_Count": len(grievances),
+        "Event_List": list(members),
+    }
+
+
+def _mhids_reached(state, entities, scope):
+    """MHIDs outside scope whose accumulated entities satisfy the Step 3 rule
+    with entities (supplier AND mill/plot, possibly from different events)"""
+    index, mhid_of = state["event_index"], state["mhid_of"]
+
+    def mhids(hits):
+        return {mhid_of[e] for e in hits if e not in scope}
+
+    sup = mhids(postings_hits(index, "Suppliers", entities["Suppliers"]))
+    if not sup:
+        return sup
+    infra = mhids(postings_hits(index, "Mills", entities["Mills"]) |
+                  postings_hits(index, "PIOConcessions", entities["PIOConcessions"]))
+    return sup & infra
+
+
+def apply_export(state, export):
+    """Bring the state up to date with a parsed export (loader.load_grievances).
+    Returns (updated MHIDs, removed MHIDs, stats); MHIDs are listed in
+    numbering order."""
+    new, changed, deleted, versions = diff_export(state, export)
+    stats = {"new": len(new), "changed": len(changed), "deleted": len(deleted)}
+    touched = new | changed | deleted
+    if not touched:
+        return [], [], stats
+
+    vocabs = state["vocabs"]
+
+    # ---- Step 1 for the delta only
+    delta = export[export["ID"].isin(new | changed)].copy()
+    for col in ENTITY_LIST_COLS:
+        delta[col] = delta[col].apply(split_entities).apply(vocabs[col].encode)
+    delta_rows = expand_sources(delta, pattern=SOURCE_SPLIT_NOTW)
+    delta_rows["Source"] = vocabs["Source"].codes(delta_rows["Source"])
+
+    rows = state["rows"]
+    if rows is None:
+        rows = delta_rows.iloc[:0]
+    stale = rows[rows["ID"].isin(changed | deleted)]
+    affected_sources = set(stale["Source"].dropna()) | set(delta_rows["Source"].dropna())
+    rows = pd.concat([rows[~rows["ID"].isin(changed | deleted)], delta_rows], ignore_index=True)
+    state["rows"] = rows
+
+    for gid in deleted:
+        state["versions"].pop(gid, None)
+        state["tracker"].pop(gid, None)
+    for gid in new | changed:
+        state["versions"][gid] = versions[gid]
+    # first row per ID, as the drop_duplicates(keep="first") lookup in RG-Notw.py
+    first = delta.drop_duplicates(subset=["ID"], keep="first").set_index("ID")
+    state["tracker"].update(first[TRACKER_COLS].to_dict("index"))
+
+    # ---- Step 2: recompute the events of the affected Sources
+    events, index, mhid_of = state["events"], state["event_index"], state["mhid_of"]
+    old_events = [e for e, evt in events.items() if evt["Source"][0] in affected_sources]
+    old_by_members = {
+        (events[e]["Source"][0], tuple(events[e]["Grievance_List"])): e for e in old_events
+    }
+    prior = dict(mhid_of)   # MHIDs before this run, also for reused Event_IDs
+    touched_mhids = {mhid_of[e] for e in old_events if e in mhid_of}
+    for e in old_events:
+        remove_from_index(index, e, _event_entities(events[e]))
+        del events[e]
+        mhid_of.pop(e, None)
+
+    fresh = []
+    part = rows[rows["Source"].isin(affected_sources)]
+    if len(part):
+        df_step2 = merge_per_source(part)
+        for evt in df_step2.to_dict("records"):
+            evt["Source"] = np.array([evt["Source"]], dtype=np.int32)
+            key = (evt["Source"][0], tuple(evt["Grievance_List"]))
+            eid = old_by_members.get(key)
+            if eid is None:
+                eid = f"EVT_{state['next_event']}"
+                state["next_event"] += 1
+            evt["Event_ID"] = eid
+            events[eid] = evt
+            fresh.append(eid)
+
+    # ---- Step 3: recompute the MHIDs the changed events belong to or reach
+    scope = set(fresh)
+    for m in touched_mhids:
+        scope.update(e for e in state["mhids"][m]["Event_List"] if e in events)
+    for e in fresh:
+        add_to_index(index, e, _event_entities(events[e]))
+
+    # cluster the scope to a fixpoint (as RG-Notw.py); untouched MHIDs a
+    # resulting cluster links to are pulled in whole and the scope reclustered
+    while True:
+        order = sorted(scope, key=lambda e: int(e.split("_")[1]))
+        rows = [_event_entities(events[e]) for e in order]
+        labels = step3_fixpoint(pd.DataFrame(rows, columns=ENTITY_COLS), vocabs,
+                                cluster_pairs(len(order), step3_pairs(rows)))
+        clusters = group_members(labels)
+        reached = set()
+        for members in clusters:
+            entities = {col: union_codes(rows[i][col] for i in members) for col in ENTITY_COLS}
+            reached |= _mhids_reached(state, entities, scope)
+        if not reached:
+            break
+        for m in reached:
+            scope.update(e for e in state["mhids"][m]["Event_List"] if e in events)
+        touched_mhids |= reached
+
+    updated, claimed = [], set()
+    for members in clusters:
+        member_ids = [order[i] for i in members]
+        previous = sorted(
+            {prior[e] for e in member_ids if e in prior} - claimed,
+            key=lambda m: int(m.split("_")[1])
+        )
+        if previous:
+            mhid = previous[0]
+        else:
+            mhid = f"MHID_{state['next_mhid']}"
+            state["next_mhid"] += 1
+        claimed.add(mhid)
+        for e in member_ids:
+            mhid_of[e] = mhid
+        state["mhids"][mhid] = _mhid_row(mhid, member_ids, events)
+        updated.append(mhid)
+
+    dirty = state.get("dirty")
+    if dirty is not None:
+        dirty["grievances"] |= touched
+        dirty["events"] |= set(old_events) | scope
+
+    removed = sorted(touched_mhids - claimed, key=lambda m: int(m.split("_")[1]))
+    for m in removed:
+        del state["mhids"][m]
+
+    updated.sort(key=lambda m: int(m.split("_")[1]))
+    stats.update({"updated_mhids": len(updated), "removed_mhids": len(removed)})
+    return updated, removed, stats
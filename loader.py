@@ -0,0 +1,159 @@
+# Step 1 loader: read the Airtable grid export once and expand each grievance
+# into one row per Source.
+# Replaces the iterrows() / row.copy() loop: one vectorized split + explode,
+# carrying only the columns the merge steps read (no Attachments / logo blobs).
+
+import copy
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:  # pyarrow is optional, fall back to the pandas C parser
+    pa = None
+
+from vocab import VOCAB_COLS, new_vocabs
+
+# inputs, overridable from the environment (pipeline.py --input / --data-dir):
+# relative names are read from DATA_DIR
+INPUT_FILE = os.environ.get("GRIEVANCE_INPUT", "Grievances-Grid view 3.csv")
+DATA_DIR = os.environ.get("GRIEVANCE_DATA_DIR", "")
+
+# columns any step reads from the grievance export (merge, issue grouping,
+# tracker lookup, incremental change detection)
+GRIEVANCE_COLS = [
+    "ID", "Date Filed", "Source", "Suppliers", "Mills", "PIOConcessions",
+    "PIOConcessions-v2", "Issues", "Issues Combined", "Company Tracker",
+    "Tracker Company AirtableRecIDs", "Created", "Last Modified",
+]
+
+DATE_FORMATS = {
+    "Date Filed": "%m/%d/%Y",              # 6/1/2018
+    "Created": "%m/%d/%Y %I:%M%p",         # 7/23/2020 4:50am
+    "Last Modified": "%m/%d/%Y %I:%M%p",
+}
+
+# columns Steps 2-3 need from each expanded row
+STEP1_COLS = ["ID", "Date Filed", "Suppliers", "Mills", "PIOConcessions", "Issues", "Raw_ID"]
+
+# Source split rule: comma NOT followed by whitespace
+# ("Rapid Response 1,Rapid Response 15" -> 2 sources, "Enough is Enough, ..." -> 1)
+SOURCE_SPLIT = r",(?!\s)"
+# RG-Notw.py's rule: comma followed by a non-space character. Same split except
+# for a trailing comma, which stays part of the last source ("A,B," -> "A", "B,")
+# instead of ending it
+SOURCE_SPLIT_NOTW = r",(?=\S)"
+
+# placeholder tokens RG-deforestation-elsetw.py drops from entity / Source lists;
+# the other scripts keep them as names (as their own splitters did)
+NULL_TOKENS = ("nan", "none")
+
+# multi-value entity columns, split + interned once by load_normalized()
+ENTITY_LIST_COLS = ["Suppliers", "Mills", "PIOConcessions", "PIOConcessions-v2", "Issues"]
+
+# parsed state shared by every scenario run in this process (and inherited by
+# workers forked from run_scenarios.py)
+_normalized = {}
+_lookups = {}
+
+
+def _read_columns(path, columns):
+    # map stripped names back to the raw header ("ID " -> "ID")
+    header = pd.read_csv(path, nrows=0).columns
+    raw = {c.strip(): c for c in header}
+    present = [raw[c] for c in columns if c in raw]
+
+    if pa is not None:
+        # newlines_in_values: Notes / Grievance Updates contain quoted line breaks
+        table = pa_csv.read_csv(
+            path,
+            parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+            convert_options=pa_csv.ConvertOptions(
+                include_columns=present,
+                column_types={c: pa.string() for c in present},
+                strings_can_be_null=True,
+            ),
+        )
+        df = table.to_pandas()
+    else:
+        df = pd.read_csv(path, usecols=present, dtype=str)
+
+    df.columns = [c.strip() for c in df.columns]
+    # columns missing from this export come back empty instead of a KeyError
+    for c in columns:
+        if c not in df.columns:
+            df[c] = pd.Series(np.nan, index=df.index, dtype=object)
+    return df[columns]
+
+
+def data_path(path):
+    """input file name -> path under DATA_DIR (absolute paths unchanged)"""
+    return os.path.join(DATA_DIR, path)
+
+
+def load_grievances(path, columns=GRIEVANCE_COLS):
+    """Parse the grid export once: only `columns`, strings as str, Date Filed /
+    Created / Last Modified as datetime64 (unparseable -> NaT), plus Raw_ID."""
+    df = _read_columns(data_path(path), columns)
+    for col, fmt in DATE_FORMATS.items():
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col], format=fmt, errors="coerce")
+    df["Raw_ID"] = df.index.astype(int)
+    return df
+
+
+def split_sources(source, pattern=SOURCE_SPLIT, null_tokens=()):
+    """Vectorized split_source(): Series of raw Source cells -> exploded Series
+    (index = original row). Rows without any source keep one NaN entry.
+    null_tokens: parts (case-insensitive) dropped like empty ones."""
+    parts = source.str.strip().str.split(pattern, regex=True).explode().str.strip()
+    parts = parts.where((parts != "") & ~parts.str.lower().isin(null_tokens))
+    has_source = parts.notna().groupby(level=0).transform("any")
+    keep = parts.notna() | (~has_source & ~parts.index.duplicated())
+    return parts[keep]
+
+
+def expand_sources(df, cols=STEP1_COLS, pattern=SOURCE_SPLIT, null_tokens=()):
+    """One row per (grievance, Source) with the same Raw_ID / Row_ID numbering
+    as the old loop: Row_ID is the original row index, repeated per source."""
+    sources = split_sources(df["Source"], pattern, null_tokens)
+    out = df.loc[sources.index, [c for c in cols if c in df.columns]]
+    out["Source"] = np.where(sources.notna(), sources, None)
+    out["Row_ID"] = out.index.astype(int)
+    return out
+
+
+def split_entities(cell, null_tokens=()):
+    """"[A, B; C]" -> ["A", "B", "C"]; empty entries dropped, and entries in
+    null_tokens (case-insensitive, e.g. NULL_TOKENS)"""
+    if pd.isna(cell) or str(cell).strip() == "":
+        return []
+    s = str(cell).replace("[", "").replace("]", "")
+    parts = [p.strip() for p in re.split("[,;]", s)]
+    return [p for p in parts if p and p.lower() not in null_tokens]
+
+
+def load_normalized(path, null_tokens=()):
+    """load_grievances() with ENTITY_LIST_COLS split (split_entities) and
+    interned as sorted int32 code arrays. Parsed once per path + null_tokens;
+    every caller gets its own copy of the frame and of the vocabularies."""
+    key = (path, tuple(null_tokens))
+    if key not in _normalized:
+        df = load_grievances(path)
+        vocabs = new_vocabs(VOCAB_COLS + ["PIOConcessions-v2"])
+        for col in ENTITY_LIST_COLS:
+            df[col] = df[col].apply(split_entities, null_tokens=null_tokens).apply(vocabs[col].encode)
+        _normalized[key] = (df, vocabs)
+    df, vocabs = _normalized[key]
+    return df.copy(), copy.deepcopy(vocabs)
+
+
+def read_lookup(path):
+    """Concessions / Mills grid export (all str), read once per path"""
+    if path not in _lookups:
+        _lookups[path] = pd.read_csv(data_path(path), dtype=str)
+    return _lookups[path].copy()
@@ -0,0 +1,96 @@
+# Command-line entry point for the merge pipeline.
+# Picks scenarios (or groups of them) and points inputs / outputs elsewhere
+# without editing the scripts. Only argparse / os run before the scenarios
+# are chosen: pandas comes in with run_scenarios, and torch /
+# sentence-transformers only inside an AI scenario that has a text to encode
+# (cached embeddings need no model), so a rule-only run starts fast.
+#
+#   python pipeline.py                              -> rule scenarios
+#   python pipeline.py all                          -> rules + AI Step 4
+#   python pipeline.py notw window90 --out-dir out  -> these, outputs in out/
+#   python pipeline.py ai --step3 runs/Step3.parquet
+#   python pipeline.py --list
+
+import argparse
+import os
+import sys
+import time
+
+START = time.time()
+
+# kept in sync with run_scenarios.SCENARIOS (not imported: it pulls in pandas)
+RULE_SCENARIOS = ["notw", "deforestation", "window90", "direct"]
+AI_SCENARIOS = ["ai", "ai-override"]    # embedding model, reads Step3.parquet
+
+GROUPS = {
+    "rules": RULE_SCENARIOS,
+    "all": RULE_SCENARIOS + AI_SCENARIOS,
+}
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Run grievance merge scenarios.")
+    parser.add_argument("scenarios", nargs="*", default=["rules"],
+                        help="scenario or group names (default: rules); see --list")
+    parser.add_argument("--input", help="grievance grid export (default: Grievances-Grid view 3.csv)")
+    parser.add_argument("--data-dir", help="folder holding the export and the Concessions / Mills lookups")
+    parser.add_argument("--step3", help="Step 3 Parquet for the AI scenarios (default: Step3.parquet)")
+    parser.add_argument("--out-dir", help="write outputs (and embedding_cache/) here")
+    parser.add_argument("--serial", action="store_true", help="no process pool (debugging)")
+    parser.add_argument("--list", action="store_true", help="list scenarios and groups, then exit")
+    return parser.parse_args(argv)
+
+
+def expand(names):
+    """group names -> scenario names, in order, without duplicates"""
+    out = []
+    for name in names:
+        for n in GROUPS.get(name, [name]):
+            if n not in out:
+                out.append(n)
+    return out
+
+
+def set_paths(args):
+    """Hand the input overrides to loader / stage_io through the environment
+    (read at import, inherited by forked workers), then move to --out-dir.
+    Paths are made absolute first so they survive the chdir."""
+    if args.input:
+        os.environ["GRIEVANCE_INPUT"] = os.path.abspath(args.input)
+    if args.data_dir:
+        os.environ["GRIEVANCE_DATA_DIR"] = os.path.abspath(args.data_dir)
+    elif args.out_dir:
+        os.environ["GRIEVANCE_DATA_DIR"] = os.getcwd()
+    if args.step3:
+        os.environ["GRIEVANCE_STEP3"] = os.path.abspath(args.step3)
+    elif args.out_dir:
+        os.environ["GRIEVANCE_STEP3"] = os.path.abspath("Step3.parquet")
+    if args.out_dir:
+        os.makedirs(args.out_dir, exist_ok=True)
+        os.chdir(args.out_dir)
+
+
+def main(argv):
+    args = parse_args(argv)
+    if args.list:
+        print("Scenarios: " + ", ".join(RULE_SCENARIOS + AI_SCENARIOS))
+        print("  (AI, need the embedding model for uncached texts: " + ", ".join(AI_SCENARIOS) + ")")
+        for group, members in GROUPS.items():
+            print(f"Group {group}: {', '.join(members)}")
+        return
+
+    names = expand(args.scenarios)
+    unknown = [n for n in names if n not in RULE_SCENARIOS + AI_SCENARIOS]
+    if unknown:
+        sys.exit(f"Unknown scenario(s): {', '.join(unknown)} "
+                 f"(choose from {', '.join(RULE_SCENARIOS + AI_SCENARIOS)} or {', '.join(GROUPS)})")
+
+    set_paths(args)
+    from run_scenarios import report, run_all   # loader reads the overrides at import
+
+    print(f"[RUN] {', '.join(names)} (startup {time.time() - START:.2f}s)")
+    report(run_all(names, args.serial), START)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,59 @@
+# Proximity grouping for plots / mills (Step 2 refine, split_by_proximity).
+# Centroids go into a KD-tree (scipy cKDTree) and one radius query at max_km
+# returns every close pair as a sparse edge list, which feeds
+# connected_components directly: no n x n Python adjacency and no shapely
+# distance() per pair. Coordinates are the projected EPSG:3857 metres the
+# notebooks already use, so the edges are exactly dist_km(a, b) <= max_km.
+# Rows without a centroid get no edges (own component).
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
+
+
+def centroid_xy(points):
+    """GeoSeries / list of shapely Points -> n x 2 float array (NaN if missing)"""
+    if hasattr(points, "x"):  # GeoSeries: vectorized, NaN for missing / empty
+        return np.column_stack([np.asarray(points.x, dtype=float), np.asarray(points.y, dtype=float)])
+    xy = np.full((len(points), 2), np.nan)
+    for k, p in enumerate(points):
+        if p is not None and not p.is_empty:
+            xy[k] = p.x, p.y
+    return xy
+
+
+def proximity_pairs(xy, max_km):
+    """(i, j) arrays, i < j, of rows whose centroids are at most max_km apart"""
+    xy = np.asarray(xy, dtype=float)
+    ok = np.flatnonzero(np.isfinite(xy).all(axis=1))
+    if len(ok) < 2:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    pts = xy[ok]
+    # a hair wider than max_km, then the exact test (same formula as GEOS distance)
+    pairs = cKDTree(pts).query_pairs(max_km * 1000.0 * (1 + 1e-9), output_type="ndarray")
+    d = pts[pairs[:, 0]] - pts[pairs[:, 1]]
+    keep = np.sqrt(d[:, 0] * d[:, 0] + d[:, 1] * d[:, 1]) / 1000.0 <= max_km
+    i, j = ok[pairs[keep, 0]], ok[pairs[keep, 1]]
+    return np.minimum(i, j), np.maximum(i, j)
+
+
+def proximity_labels(xy, max_km):
+    """(n_components, labels) of the "within max_km" graph; components are
+    numbered by their first row, as with the dense adjacency matrix"""
+    n = len(xy)
+    i, j = proximity_pairs(xy, max_km)
+    graph = sp.csr_matrix((np.ones(len(i), dtype=np.int8), (i, j)), shape=(n, n))
+    n_components, labels = connected_components(graph, directed=False)
+    return int(n_components), labels
+
+
+def proximity_groups(indices, xy, max_km):
+    """list of index-lists, one per proximity component, in component order"""
+    indices = list(indices)
+    if len(indices) <= 1:
+        return [indices]
+    n_components, labels = proximity_labels(xy, max_km)
+    order = np.argsort(labels, kind="stable")
+    bounds = np.searchsorted(labels[order], np.arange(n_components + 1))
+    return [[indices[k] for k in order[bounds[c]:bounds[c + 1]]] for c in range(n_components)]
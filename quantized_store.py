@@ -0,0 +1,101 @@
+# Quantized embedding rows for the similarity kernels.
+# int8 keeps one float32 scale per row (x ~= q * scale, scale = max|x| / 127),
+# float16 needs none; either is 2-4x smaller than float32 and is read from a
+# memory-mapped file, so worker processes share the same pages. Kernels
+# dequantize one tile at a time (block()); callers that need exact scores
+# rescore the hits against the float32 rows.
+
+import numpy as np
+
+DTYPES = {"int8": np.int8, "float16": np.float16}
+
+# Cosine error bound on quantized rows, used to lower the scan threshold
+# before the exact rescoring. For unit rows x and their copies q = x + e,
+# |q_i . q_j - x_i . x_j| <= |e_i| + |e_j| + |e_i| |e_j|, with
+#   int8:    rounding moves each component by at most scale / 2, so
+#            |e| <= scale / 2 * sqrt(d)
+#   float16: relative rounding error <= 2**-11 per component, so |e| <= 2**-11
+# (the float32 accumulation error is orders of magnitude smaller)
+FLOAT16_EPS = 2.0 ** -11
+
+
+def error_bound(row_errors):
+    """cosine margin for rows whose quantization error norms are row_errors"""
+    e = float(np.max(row_errors)) if len(row_errors) else 0.0
+    return 2 * e + e * e
+
+
+def quantize(E, dtype):
+    """float32 rows -> (data, scales); scales is None for float16"""
+    E = np.asarray(E, dtype=np.float32)
+    if dtype == "float16":
+        return E.astype(np.float16), None
+    scales = np.abs(E).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    data = np.rint(E / scales[:, None]).astype(np.int8)
+    return data, scales.astype(np.float32)
+
+
+class QuantizedVectors:
+    """int8 (+ per-row scale) or float16 rows, possibly memmapped"""
+
+    def __init__(self, data, scales=None):
+        self.data = data
+        self.scales = scales
+        self.dtype = "int8" if scales is not None else "float16"
+        self._margin = None
+
+    @classmethod
+    def from_float32(cls, E, dtype="int8"):
+        return cls(*quantize(E, dtype))
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, idx):
+        """row subset (fancy index) as a new QuantizedVectors"""
+        return QuantizedVectors(
+            np.asarray(self.data[idx]),
+            None if self.scales is None else np.asarray(self.scales[idx])
+        )
+
+    @property
+    def margin(self):
+        """max cosine error between any two rows (see error_bound)"""
+        if self._margin is None:
+            if self.scales is None:
+                self._margin = error_bound([FLOAT16_EPS])
+            else:
+                d = self.data.shape[1]
+                self._margin = error_bound(np.asarray(self.scales) / 2 * np.sqrt(d))
+        return self._margin
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes + (0 if self.scales is None else self.scales.nbytes)
+
+    def block(self, start, stop):
+        """rows start:stop dequantized to float32"""
+        out = np.asarray(self.data[start:stop], dtype=np.float32)
+        if self.scales is not None:
+            out *= self.scales[start:stop, None]
+        return out
+
+
+def as_float32(E):
+    return E.block(0, len(E)) if isinstance(E, QuantizedVectors) else np.asarray(E, dtype=np.float32)
+
+
+class RowView:
+    """Rows of a (memmapped) array through an index map, read on demand:
+    view[k] = array[rows[k]], so the full float32 file never has to be loaded"""
+
+    def __init__(self, array, rows):
+        self.array = array
+        self.rows = np.asarray(rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, idx):
+        return np.asarray(self.array[self.rows[idx]])
@@ -1,206 +1,91 @@
-import pandas as pd
-import ast
-import re
-
-# Load file
-df = pd.read_csv("Grievances-Grid view 3.csv", dtype=str)
-df.columns = [c.strip() for c in df.columns]
+from loader import load_normalized, expand_sources
 
-# Tambahkan ID yang akan dipakai sampai Step 3
-df["Raw_ID"] = df.index.astype(int)
-
-# -----------------------------------------
-# CLEAN + SPLIT function
-# -----------------------------------------
-def split_list(cell):
-    if pd.isna(cell) or str(cell).strip() == "":
-        return []
-    s = str(cell).replace("[", "").replace("]", "")
-    parts = [p.strip() for p in re.split("[,;]", s)]
-    return list({p for p in parts if p})
-
-# Columns to normalize
-multi_cols = ["Suppliers", "Mills", "PIOConcessions", "Issues"]
-
-for col in multi_cols:
-    df[col] = df[col].apply(split_list)
-
-# Source split (SPECIAL rule)
-def split_source(val):
-    if pd.isna(val) or str(val).strip() == "":
-        return []
-    #s = str(val).replace("[", "").replace("]", "")
-    s = str(val).strip()
-    parts = re.split(r",(?!\s)", s)
-    #parts = re.split("[,;]", s)
-    parts = [p.strip() for p in parts if p.strip()]
-    return parts
-
-df["Source"] = df["Source"].apply(split_source)
+# Load file sekali saja (kolom yang dipakai saja, Date Filed sudah datetime,
+# Raw_ID = ID yang akan dipakai sampai Step 3). Suppliers / Mills /
+# PIOConcessions / Issues sudah di-split jadi int32 codes (vocabs), nama
+# baru di-decode saat export
+df_grievances, vocabs = load_normalized("Grievances-Grid view 3.csv")
+df = df_grievances.copy()
 
 # -----------------------------------------
 # Step 1: Expand Source → 1 row per source
+# (split koma tanpa spasi, satu explode, hanya kolom yang dipakai Step 2–3;
+#  Row_ID = index baris asli, sama seperti loop lama)
 # -----------------------------------------
-expanded_rows = []
-
-for idx, row in df.iterrows():
-    raw_id = row["Raw_ID"]
-    sources = row["Source"]
-
-    # Jika tidak ada source → tetap simpan 1 row
-    if len(sources) == 0:
-        new_row = row.copy()
-        new_row["Source"] = None
-        expanded_rows.append(new_row)
-        continue
-
-    # Jika ada banyak source → pecah
-    for src in sources:
-        new_row = row.copy()
-        new_row["Source"] = src      # hanya 1 source
-        new_row["Raw_ID"] = raw_id   # tetap sama
-        expanded_rows.append(new_row)
-
-df_expanded = pd.DataFrame(expanded_rows)
-
-# Tambahkan Row_ID unik untuk Step 2–3
-df_expanded["Row_ID"] = df_expanded.index.astype(int)
+df_expanded = expand_sources(df)
+df_expanded["Source"] = vocabs["Source"].codes(df_expanded["Source"])
 
 print("Original grievances:", df.shape[0])
 print("Expanded rows:", df_expanded.shape[0])
 df_expanded.head()
 
 
-df2 = df_expanded.copy()
-
-# Helper: unique sorted list
-def uniq_list(x):
-    return sorted(list(set(x)))
+import numpy as np
+import pandas as pd
 
-events = []
-event_id = 1
+from events import merge_per_source
+from stage_io import (STEP2_FILE, STEP3_FILE, STEP2_LIST_COLS, STEP2_DATE_COLS,
+                      STEP3_LIST_COLS, STEP3_DATE_COLS, read_stage, write_stage)
+from vocab import Vocab, union_codes, decode_columns
 
 # ---- CLUSTER PER SOURCE ----
-for source, group in df2.groupby("Source"):
-    group = group.reset_index(drop=True)
-
-    source_events = []
-
-    for idx, row in group.iterrows():
-
-        # Ambil entitas
-        sup = set(row["Suppliers"])
-        mil = set(row["Mills"])
-        pio = set(row["PIOConcessions"])
-        iss = set(row["Issues"])
-
-        # IMPORTANT → Grievance ID asli
-        gid = row["ID"]
-
-        # Date Filed asli
-        date_filed = row["Date Filed"]
-
-        merged = False
-
-        # Cek overlap
-        for evt in source_events:
-
-            overlap = (
-                len(sup & set(evt["Suppliers"])) > 0 or
-                len(mil & set(evt["Mills"])) > 0 or
-                len(pio & set(evt["PIOConcessions"])) > 0
-            )
-
-            if overlap:
-                # Merge entitas
-                evt["Suppliers"] = uniq_list(list(set(evt["Suppliers"]) | sup))
-                evt["Mills"] = uniq_list(list(set(evt["Mills"]) | mil))
-                evt["PIOConcessions"] = uniq_list(list(set(evt["PIOConcessions"]) | pio))
-                evt["Issues"] = uniq_list(list(set(evt["Issues"]) | iss))
-
-                # Merge grievance list
-                evt["Grievance_List"].append(gid)
-                evt["Grievance_List"] = uniq_list(evt["Grievance_List"])
-                evt["Grievance_Count"] = len(evt["Grievance_List"])
-
-                # Merge Date Filed → ambil yang paling lama
-                evt["Date Filed_List"].append(date_filed)
-                evt["Date Filed_List"] = uniq_list(evt["Date Filed_List"])
-                evt["Date Filed"] = min(evt["Date Filed_List"])
-
-                merged = True
-                break
-
-        # Tidak overlap → buat event baru
-        if not merged:
-            source_events.append({
-                "Event_ID": f"EVT_{event_id}",
-                "Source": source,
-
-                "Suppliers": uniq_list(list(sup)),
-                "Mills": uniq_list(list(mil)),
-                "PIOConcessions": uniq_list(list(pio)),
-                "Issues": uniq_list(list(iss)),
-
-                "Grievance_List": [gid],
-                "Grievance_Count": 1,
-
-                # Simpan Date Filed list & final date
-                "Date Filed_List": [date_filed],
-                "Date Filed": date_filed
-            })
-            event_id += 1
+# connected components lewat entitas yang sama (suppliers / mills / plots),
+# union_codes per event; Grievance_List = ID grievance asli, Date Filed = yang
+# paling lama
+df_step2 = merge_per_source(df_expanded)
+df_step2 = df_step2.rename(columns={"Date_Filed_List": "Date Filed_List", "Date_Filed": "Date Filed"})
+
+# codes -> nama untuk Parquet
+decode_columns(df_step2, vocabs, ["Suppliers", "Mills", "PIOConcessions", "Issues"])
+df_step2["Source"] = df_step2["Source"].map(lambda c: vocabs["Source"].values[c])
+
+# List tetap list (list<string> / date32 di Parquet), tidak di-join jadi string
+df_step2["Date Filed_List"] = df_step2["Date Filed_List"].apply(
+    lambda x: [d for d in x if pd.notna(d)]
+)
+
+write_stage(df_step2, STEP2_FILE, STEP2_LIST_COLS, STEP2_DATE_COLS)
+print('total', df_step2.shape[0])
+df_step2.head(30)
 
-    events.extend(source_events)
 
-# Convert ke DataFrame
-df_step2 = pd.DataFrame(events)
 
-# Convert list → string
-for col in ["Suppliers", "Mills", "PIOConcessions", "Issues", "Grievance_List", "Date Filed_List"]:
-    df_step2[col] = df_step2[col].apply(lambda x: ", ".join(uniq_list(x)))
 
-df_step2.to_csv("Step2.csv", index=False)
-print('total', df_step2.shape[0])
-df_step2.head(30)
 
 # =========================================
 # LOAD Step 2 (output dari Step 2)
 # =========================================
-df2 = pd.read_csv("Step2.csv", dtype=str)
-df2.columns = [c.strip() for c in df2.columns]
+# list columns sudah list, Date Filed sudah datetime (Parquet)
+df2 = read_stage(STEP2_FILE, columns=[
+    "Event_ID", "Source", "Suppliers", "Mills", "PIOConcessions",
+    "Grievance_List", "Grievance_Count", "Date Filed"
+])
 
-# Convert list-like columns menjadi Python list
+# Issues Combined di CSV mentah masih string
 def to_list(cell):
     if pd.isna(cell) or cell.strip() == "":
         return []
     return [x.strip() for x in str(cell).split(",") if x.strip()]
 
-list_cols = ["Suppliers", "Mills", "PIOConcessions", "Issues", "Grievance_List"]
-for col in list_cols:
-    df2[col] = df2[col].apply(to_list)
-
 
 # =========================================
-# LOAD file tambahan (Grievances-grid view 2.csv)
-# berisi kolom Issues Combined
+# Issues Combined dari df_grievances (sudah di-load di Step 1,
+# tidak perlu baca Grievances-Grid view 3.csv lagi)
 # =========================================
-df_original_grievances = pd.read_csv("Grievances-Grid view 3.csv", dtype=str)
-df_original_grievances.columns = [c.strip() for c in df_original_grievances.columns]
+issues_lists = df_grievances["Issues Combined"].apply(to_list)
 
-# Convert Issues Combined ke list
-df_original_grievances["Issues Combined"] = df_original_grievances["Issues Combined"].apply(to_list)
+# codes dinomori urut nama: sorted codes == sorted names
+issue_vocab = Vocab.from_values(sorted({x for lst in issues_lists for x in lst}))
 
-# Create a mapping from original grievance ID to its 'Issues Combined'
-id_to_issues_combined_map = df_original_grievances.set_index('ID')['Issues Combined'].to_dict()
+# Create a mapping from original grievance ID to its 'Issues Combined' codes
+id_to_issues_combined_map = dict(zip(
+    df_grievances["ID"], issues_lists.apply(issue_vocab.encode)
+))
 
-# For each event in df2, collect all 'Issues Combined' from its constituent grievances
+# For each event in df2, union the issue codes of its constituent grievances
 def get_event_issues_combined(grievance_list_ids):
-    combined_issues = []
-    for gid in grievance_list_ids:
-        if gid in id_to_issues_combined_map:
-            combined_issues.extend(id_to_issues_combined_map[gid])
-    return sorted(list(set(combined_issues)))
+    return union_codes([id_to_issues_combined_map[gid] for gid in grievance_list_ids
+                        if gid in id_to_issues_combined_map])
 
 df2['Issues Combined'] = df2['Grievance_List'].apply(get_event_issues_combined)
 
@@ -236,6 +121,9 @@ for group, items in ISSUE_MAP.items():
     for it in items:
         ISSUE_TO_GROUP[it.lower()] = group
 
+# kategori per issue code (sekali per issue, bukan per event)
+CODE_TO_GROUP = np.array([ISSUE_TO_GROUP.get(v.lower(), "Other") for v in issue_vocab.values], dtype=object)
+
 
 # =========================================
 # STEP 3 – BUILDING GROUPED EVENTS
@@ -244,37 +132,22 @@ final_rows = []
 new_eid = 1
 
 for idx, row in df.iterrows():
-    issues_raw = row["Issues Combined"] if isinstance(row["Issues Combined"], list) else []
-    issues_raw = [x.strip() for x in issues_raw if x.strip()]
-
-    # tampung issues berdasarkan kategori
-    grouped = {}
-
-    for issue in issues_raw:
-        key = issue.lower()
-
-        if key in ISSUE_TO_GROUP:
-            cat = ISSUE_TO_GROUP[key]
-        else:
-            cat = "Other"
+    codes = row["Issues Combined"]
+    cats = CODE_TO_GROUP[codes]
 
-        if cat not in grouped:
-            grouped[cat] = []
-        grouped[cat].append(issue)
-
-    # Untuk setiap kategori → buat event baru
-    for cat, issue_list in grouped.items():
+    # Untuk setiap kategori (urutan kemunculan) → buat event baru
+    for cat in dict.fromkeys(cats):
         new_row = {
             "Event_ID_S3": f"EVT3_{new_eid}",
             "Original_Event_ID": row["Event_ID"],
             "Issue_Category": cat,
-            "Issues": ", ".join(sorted(set(issue_list))),
-            "Suppliers": ", ".join(row["Suppliers"]),
-            "Mills": ", ".join(row["Mills"]),
-            "PIOConcessions": ", ".join(row["PIOConcessions"]),
-            "Grievance_List": ", ".join(row["Grievance_List"]),
+            "Issues": issue_vocab.decode(codes[cats == cat]),
+            "Suppliers": row["Suppliers"],
+            "Mills": row["Mills"],
+            "PIOConcessions": row["PIOConcessions"],
+            "Grievance_List": row["Grievance_List"],
             "Grievance_Count": row["Grievance_Count"],
-            "Source": row["Source"],
+            "Source": [row["Source"]],
             "Date_Filed": row["Date Filed"]
 
         }
@@ -283,32 +156,27 @@ for idx, row in df.iterrows():
 
 # Output akhir
 df_step3 = pd.DataFrame(final_rows)
-df_step3.to_csv("Step3.csv", index=False)
+write_stage(df_step3, STEP3_FILE, STEP3_LIST_COLS, STEP3_DATE_COLS)
 
 print("Step 3 selesai. Total events:", len(df_step3))
 df_step3.head(40)
 
-import pandas as pd
-from datetime import datetime, timedelta
+from signature import code_signatures, shared, absorb
+from vocab import new_vocabs
+
+# kolom list yang di-merge: int32 code arrays, nama hanya saat export
+MERGE_COLS = ["Suppliers", "Mills", "PIOConcessions", "Source", "Grievance_List"]
 
 # =========================================
-# LOAD Step 3
+# LOAD Step 3 (list columns sudah list, Date_Filed sudah datetime)
 # =========================================
-df3 = pd.read_csv("Step3.csv", dtype=str)
-df3.columns = [c.strip() for c in df3.columns]
-
-# Convert list-like ke Python list
-def to_list(cell):
-    if pd.isna(cell) or cell.strip() == "":
-        return []
-    return [x.strip() for x in str(cell).split(",") if x.strip()]
-
-list_cols = ["Suppliers", "Mills", "PIOConcessions", "Grievance_List", "Source"]
-for col in list_cols:
-    df3[col] = df3[col].apply(to_list)
-
-# Convert Date Filed ke datetime
-df3["Date_Filed"] = pd.to_datetime(df3["Date_Filed"], errors='coerce')
+df3 = read_stage(STEP3_FILE, columns=[
+    "Issue_Category", "Suppliers", "Mills", "PIOConcessions", "Source",
+    "Grievance_List", "Grievance_Count", "Date_Filed"
+])
+vocabs4 = new_vocabs(MERGE_COLS)
+for col in MERGE_COLS:
+    df3[col] = df3[col].apply(vocabs4[col].encode)
 
 # =========================================
 # Step 4 – Merge logic baru
@@ -331,16 +199,19 @@ def in_time_window(issue_cat, date_new, date_latest):
 # Loop per Issue Category
 for cat, group in df3.groupby("Issue_Category"):
     group = group.sort_values("Date_Filed").reset_index(drop=True)
+    # supplier / mill / plot bitsets per row; event bitsets grow in place on merge
+    sigs = code_signatures(group)
     active_events = []
+    active_sigs = []
 
-    for idx, row in group.iterrows():
+    for (idx, row), sig in zip(group.iterrows(), sigs):
         merged = False
 
-        for evt in active_events:
+        for evt, evt_sig in zip(active_events, active_sigs):
             # Hitung overlap
-            supplier_overlap = len(set(row["Suppliers"]) & set(evt["Suppliers"]))
-            mill_overlap = len(set(row["Mills"]) & set(evt["Mills"]))
-            plot_overlap = len(set(row["PIOConcessions"]) & set(evt["PIOConcessions"]))
+            supplier_overlap = shared(sig[0], evt_sig[0])
+            mill_overlap = shared(sig[1], evt_sig[1])
+            plot_overlap = shared(sig[2], evt_sig[2])
 
             # ✅ Syarat baru:
             has_supplier = supplier_overlap >= 1
@@ -349,17 +220,15 @@ for cat, group in df3.groupby("Issue_Category"):
             # Check merge
             if has_supplier and has_asset and in_time_window(cat, row["Date_Filed"], evt["Latest_Date"]):
 
-                evt["Suppliers"] = sorted(list(set(evt["Suppliers"]) | set(row["Suppliers"])))
-                evt["Mills"] = sorted(list(set(evt["Mills"]) | set(row["Mills"])))
-                evt["PIOConcessions"] = sorted(list(set(evt["PIOConcessions"]) | set(row["PIOConcessions"])))
-                evt["Source"] = sorted(list(set(evt["Source"]) | set(row["Source"])))
-                evt["Grievance_List"] = sorted(list(set(evt["Grievance_List"]) | set(row["Grievance_List"])))
+                for col in MERGE_COLS:
+                    evt[col] = union_codes([evt[col], row[col]])
                 evt["Grievance_Count"] = len(evt["Grievance_List"])
 
                 # Update tanggal
                 evt["Earliest_Date"] = min(evt["Earliest_Date"], row["Date_Filed"])
                 evt["Latest_Date"] = max(evt["Latest_Date"], row["Date_Filed"])
 
+                absorb(evt_sig, sig)
                 merged = True
                 break
 
@@ -377,6 +246,7 @@ for cat, group in df3.groupby("Issue_Category"):
                 "Earliest_Date": row["Date_Filed"],
                 "Latest_Date": row["Date_Filed"]
             })
+            active_sigs.append(list(sig))
             mhid_id += 1
 
     merged_events.extend(active_events)
@@ -386,8 +256,9 @@ for cat, group in df3.groupby("Issue_Category"):
 # ========================================
 df_step4 = pd.DataFrame(merged_events)
 
-# Convert list → string
-for col in ["Suppliers", "Mills", "PIOConcessions", "Source", "Grievance_List"]:
+# Convert codes → nama → string
+decode_columns(df_step4, vocabs4, MERGE_COLS)
+for col in MERGE_COLS:
     df_step4[col] = df_step4[col].apply(lambda x: ", ".join(x))
 
 # Convert tanggal ke string
@@ -0,0 +1,133 @@
+# Multi-scenario runner.
+# Parses + normalizes the grievance export and the Concessions / Mills lookups
+# once, then runs any set of merge scenarios from that shared state.
+# Scenarios run side by side in a forked process pool: every worker inherits
+# the parsed frames (loader memo) instead of re-reading and re-splitting the
+# CSVs, and each scenario script still writes its usual output file.
+#
+#   python run_scenarios.py                      -> all scenarios
+#   python run_scenarios.py notw window90        -> only these
+#   python run_scenarios.py --serial notw        -> no pool (debugging)
+
+import contextlib
+import io
+import multiprocessing as mp
+import os
+import runpy
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from loader import INPUT_FILE, NULL_TOKENS, data_path, load_normalized, read_lookup
+
+# =====================================================
+# CONFIG
+# =====================================================
+LOOKUP_FILES = [
+    "PIOConcessions-v2-Grid view.csv",
+    "Concessions-v2-Grid view (5).csv",
+    "Mills-Grid view (10).csv",
+]
+
+# name -> (script, frame holding the final events)
+SCENARIOS = {
+    "notw": ("RG-Notw.py", "df_final"),                          # no time window
+    "deforestation": ("RG-deforestation-elsetw.py", "df_final"), # deforestation split
+    "window90": ("Fix with timewindo.py", "df_final"),           # 90-day window
+    "direct": ("Scenario A.py", "df_final"),                     # source + infra merge
+    "ai": ("Step4 with AI.py", "final_df"),                      # AI Step 4 (reads Step3.parquet)
+    "ai-override": ("Step4 with AI part 2.py", "final_df"),      # AI source override (Step3.parquet)
+}
+
+# scenario scripts live next to this file; data files are read from the cwd
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# scenarios that read INPUT_FILE / LOOKUP_FILES (the AI steps start from Step3.parquet)
+SHARED_INPUT = {"notw", "deforestation", "window90", "direct"}
+
+
+# =====================================================
+# RUN
+# =====================================================
+def warm_up():
+    """Fill the loader memo before the pool forks"""
+    load_normalized(INPUT_FILE)
+    load_normalized(INPUT_FILE, NULL_TOKENS)   # RG-deforestation-elsetw.py
+    for path in LOOKUP_FILES:
+        if os.path.exists(data_path(path)):
+            read_lookup(path)
+
+
+def run_scenario(name):
+    """Run one scenario script in this process; stdout is captured so parallel
+    runs don't interleave. Returns (name, event count, seconds, log, error)."""
+    script, result = SCENARIOS[name]
+    log = io.StringIO()
+    start = time.time()
+    try:
+        with contextlib.redirect_stdout(log):
+            ns = runpy.run_path(os.path.join(SCRIPT_DIR, script), run_name="__main__")
+        frame = ns.get(result)
+        count = len(frame) if frame is not None else None
+        error = None
+    except Exception:
+        count = None
+        error = traceback.format_exc()
+    return name, count, time.time() - start, log.getvalue(), error
+
+
+def run_all(names, serial=False):
+    if SHARED_INPUT & set(names):
+        print("[RUN] Parsing shared input...")
+        warm_up()
+
+    # the shared state is only inherited by forked workers; elsewhere run in-process
+    use_pool = not serial and len(names) > 1 and "fork" in mp.get_all_start_methods()
+
+    results = []
+    if use_pool:
+        workers = min(len(names), os.cpu_count() or 1)
+        with ProcessPoolExecutor(workers, mp_context=mp.get_context("fork")) as pool:
+            futures = [pool.submit(run_scenario, n) for n in names]
+            for f in as_completed(futures):
+                results.append(f.result())
+                print(f"✓ {results[-1][0]} done")
+    else:
+        for n in names:
+            results.append(run_scenario(n))
+            print(f"✓ {n} done")
+    return sorted(results, key=lambda r: names.index(r[0]))
+
+
+def report(results, start):
+    """Per-scenario logs, then the summary table and any tracebacks"""
+    for name, count, secs, log, error in results:
+        print(f"\n===== {name} =====")
+        print(log.rstrip())
+
+    print("\nScenario         Script                          Events   Seconds")
+    for name, count, secs, log, error in results:
+        script = SCENARIOS[name][0]
+        shown = "FAILED" if error else ("-" if count is None else count)
+        print(f"{name:<16} {script:<31} {shown!s:>6} {secs:>9.1f}")
+    print(f"Total wall time: {time.time() - start:.1f}s")
+
+    for name, count, secs, log, error in results:
+        if error:
+            print(f"\n[{name}] failed:\n{error}")
+
+
+def main(argv):
+    serial = "--serial" in argv
+    names = [a for a in argv if a != "--serial"] or list(SCENARIOS)
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        sys.exit(f"Unknown scenario(s): {', '.join(unknown)} (choose from {', '.join(SCENARIOS)})")
+
+    start = time.time()
+    report(run_all(names, serial), start)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,43 @@
+# Bitset entity signatures for the greedy Step 4 merge loops.
+# Every distinct supplier / mill / plot gets one bit (its vocab code), so a row
+# or an event is one Python int per entity kind. "Any shared entity" becomes
+# a & b and the overlap count a popcount, exact (no hashing, no false hits),
+# instead of building set(row[...]) & set(evt[...]) for every comparison.
+
+from vocab import new_vocabs
+
+SIGNATURE_COLS = ["Suppliers", "Mills", "PIOConcessions"]
+
+
+def bitset(codes):
+    """int with bit c set for every code c"""
+    sig = 0
+    for c in codes:
+        sig |= 1 << int(c)
+    return sig
+
+
+def shared(a, b):
+    """Number of entities two signatures have in common"""
+    return (a & b).bit_count()
+
+
+def row_signatures(df, vocabs=None, cols=SIGNATURE_COLS):
+    """One list of bitsets (one per column, order of cols) per row of df.
+    Columns hold lists of entity names."""
+    if vocabs is None:
+        vocabs = new_vocabs(cols)
+    per_col = [[bitset(vocabs[c].encode(v)) for v in df[c]] for c in cols]
+    return [list(sig) for sig in zip(*per_col)]
+
+
+def code_signatures(df, cols=SIGNATURE_COLS):
+    """row_signatures() for columns that already hold vocab code arrays"""
+    per_col = [[bitset(v) for v in df[c]] for c in cols]
+    return [list(sig) for sig in zip(*per_col)]
+
+
+def absorb(evt_sig, row_sig):
+    """Event absorbs a row: OR the row's bits into the event signature in place"""
+    for k, s in enumerate(row_sig):
+        evt_sig[k] |= s
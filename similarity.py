@@ -0,0 +1,119 @@
+# Blocked cosine similarity for the AI Step 4 scripts.
+# Rows (normalized embeddings) are sorted by date and compared tile by tile
+# (E[a:a+T] @ E[b:b+T].T), skipping tiles the date band rules out. Only pairs
+# at or above the threshold come back, as an edge list, so memory stays at
+# one T x T tile and BLAS does the pair loop instead of the interpreter.
+# E may also be a QuantizedVectors (quantized_store.py): tiles are dequantized
+# on the fly, and with rescore= the float32 rows the hits are re-checked
+# exactly, so the result does not depend on the storage dtype.
+
+import numpy as np
+import pandas as pd
+
+from quantized_store import QuantizedVectors
+
+TILE = 512
+
+
+def day_numbers(dates):
+    """dates -> float days since epoch (NaN for NaT)"""
+    d = pd.to_datetime(pd.Series(dates)).to_numpy().astype("datetime64[D]")
+    days = d.astype(np.int64).astype(float)
+    days[np.isnat(d)] = np.nan
+    return days
+
+
+def rescore_pairs(i, j, rescore, threshold, strict=False):
+    """Keep the (i, j) whose exact cosine on the float32 rows passes threshold"""
+    sims = np.einsum("nd,nd->n", rescore[i], rescore[j])
+    keep = sims > threshold if strict else sims >= threshold
+    return i[keep], j[keep], sims[keep]
+
+
+def scan_threshold(E, threshold, rescore=None):
+    """Threshold for the first pass over E: lowered by the quantization error
+    bound when the hits are rescored exactly, unchanged for float32 rows"""
+    if rescore is None:
+        return threshold
+    return threshold - getattr(E, "margin", 0.0)
+
+
+def similar_pairs(E, threshold, dates=None, min_gap=None, max_gap=None, strict=False,
+                  tile=TILE, rescore=None):
+    """(i, j, sim) arrays, i < j, of rows of E with sim >= threshold (> if strict).
+    With dates, rows without a date never pair and the gap in days must satisfy
+    min_gap < gap <= max_gap (either bound may be None).
+    E: float32 rows or QuantizedVectors; rescore: float32 rows aligned with E,
+    used to re-check the hits of a quantized scan."""
+    quantized = isinstance(E, QuantizedVectors)
+    if not quantized:
+        E = np.asarray(E, dtype=np.float32)
+    scan = scan_threshold(E, threshold, rescore)
+    if dates is None:
+        order = np.arange(len(E))
+        days = None
+    else:
+        days = day_numbers(dates)
+        order = np.flatnonzero(~np.isnan(days))
+        order = order[np.argsort(days[order], kind="stable")]
+        days = days[order]
+    X = E[order]
+    block = X.block if quantized else (lambda start, stop: X[start:stop])
+    m = len(order)
+
+    out_i, out_j, out_s = [], [], []
+    for a in range(0, m, tile):
+        A = block(a, a + tile)
+        a_end = a + len(A) - 1
+        for b in range(a, m, tile):
+            b_end = min(b + tile, m) - 1
+            if days is not None:
+                # sorted by date: every later tile is further away
+                if max_gap is not None and days[b] - days[a_end] > max_gap:
+                    break
+                if min_gap is not None and days[b_end] - days[a] <= min_gap:
+                    continue
+            S = A @ block(b, b_end + 1).T
+            mask = S > scan if strict else S >= scan
+            if b == a:
+                mask &= np.triu(np.ones(mask.shape, dtype=bool), k=1)
+            if days is not None and (min_gap is not None or max_gap is not None):
+                gap = np.abs(days[a:a_end + 1, None] - days[None, b:b_end + 1])
+                if min_gap is not None:
+                    mask &= gap > min_gap
+                if max_gap is not None:
+                    mask &= gap <= max_gap
+            ii, jj = np.nonzero(mask)
+            out_i.append(order[a + ii])
+            out_j.append(order[b + jj])
+            out_s.append(S[ii, jj])
+
+    if not out_i:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    i, j, s = np.concatenate(out_i), np.concatenate(out_j), np.concatenate(out_s)
+    i, j = np.minimum(i, j), np.maximum(i, j)
+    if rescore is not None:
+        return rescore_pairs(i, j, rescore, threshold, strict)
+    return i, j, s
+
+
+def similar_pairs_by_key(E, rows, keys, threshold, dates=None, rescore=None, **kwargs):
+    """similar_pairs() among rows sharing a key (e.g. the same Source).
+    rows: labels of E rows (df index); returns {(row_a, row_b)} with
+    row_a < row_b."""
+    rows = np.asarray(rows)
+    keys = pd.Series(list(keys)).reset_index(drop=True)
+    date_values = None if dates is None else pd.Series(dates).reset_index(drop=True)
+    pairs = set()
+    for _, pos in keys.groupby(keys, sort=False).indices.items():
+        if len(pos) < 2:
+            continue
+        sub_rows = rows[pos]
+        i, j, _ = similar_pairs(
+            E[sub_rows], threshold,
+            None if date_values is None else date_values.iloc[pos],
+            rescore=None if rescore is None else np.asarray(rescore[sub_rows]), **kwargs
+        )
+        a, b = sub_rows[i], sub_rows[j]
+        pairs.update(zip(np.minimum(a, b).tolist(), np.maximum(a, b).tolist()))
+    return pairs
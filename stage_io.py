@@ -0,0 +1,61 @@
+# Step 2 / Step 3 intermediates as Parquet (Step2.parquet, Step3.parquet).
+# List columns are stored as list<string> and dates as date32, so the next
+# stage reads them back as lists / datetimes directly: no ", ".join on write,
+# no split(",") on read, and names that contain a comma survive the trip.
+
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+STEP2_FILE = "Step2.parquet"
+STEP3_FILE = os.environ.get("GRIEVANCE_STEP3", "Step3.parquet")   # pipeline.py --step3
+
+STEP2_LIST_COLS = ["Suppliers", "Mills", "PIOConcessions", "Issues", "Grievance_List", "Date Filed_List"]
+STEP2_DATE_COLS = ["Date Filed", "Date Filed_List"]
+
+STEP3_LIST_COLS = ["Suppliers", "Mills", "PIOConcessions", "Issues", "Grievance_List", "Source"]
+STEP3_DATE_COLS = ["Date_Filed"]
+
+
+def _dates(values):
+    return [None if pd.isna(d) else pd.Timestamp(d).date() for d in values]
+
+
+def write_stage(df, path, list_cols=(), date_cols=()):
+    """DataFrame -> Parquet; list_cols as list<string> (list<date32> if also in
+    date_cols), date_cols as date32, the rest inferred by pyarrow"""
+    arrays, fields = [], []
+    for col in df.columns:
+        values = df[col].tolist()
+        if col in list_cols and col in date_cols:
+            typ = pa.list_(pa.date32())
+            values = [_dates(v) for v in values]
+        elif col in list_cols:
+            typ = pa.list_(pa.string())
+            values = [[str(x) for x in v] for v in values]
+        elif col in date_cols:
+            typ = pa.date32()
+            values = _dates(values)
+        else:
+            arrays.append(pa.array(df[col], from_pandas=True))
+            fields.append(pa.field(str(col), arrays[-1].type))
+            continue
+        arrays.append(pa.array(values, type=typ))
+        fields.append(pa.field(str(col), typ))
+    pq.write_table(pa.Table.from_arrays(arrays, schema=pa.schema(fields)), path)
+
+
+def read_stage(path, columns=None):
+    """Parquet -> DataFrame, reading only `columns` (all if None). List columns
+    come back as Python lists, date32 columns as datetime64."""
+    table = pq.read_table(path, columns=columns)
+    df = table.to_pandas(date_as_object=False)
+    for i, field in enumerate(table.schema):
+        if pa.types.is_list(field.type):
+            values = table.column(i).to_pylist()
+            if pa.types.is_date(field.type.value_type):
+                values = [[pd.Timestamp(d) for d in v] for v in values]
+            df[field.name] = values
+    return df
@@ -0,0 +1,258 @@
+# SQLite store for the incremental merge state (incremental.py).
+# One file holds the normalized grievances, the interned entity names, the
+# event posting lists and the grievance -> EVT -> MHID lineage, so runs warm
+# start from it and ad-hoc questions are plain SQL, e.g.
+#
+#   SELECT DISTINCT l.mhid
+#   FROM entities n
+#   JOIN event_entities ee ON ee.kind = n.kind AND ee.code = n.code
+#   JOIN lineage l ON l.event_id = ee.event_id
+#   WHERE n.kind = 'Suppliers' AND n.name = 'Wilmar';
+
+import json
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from entity_index import ENTITY_COLS, new_index, add_to_index
+from vocab import Vocab
+
+# entity columns stored per event (posting lists); Issues ride along for output
+EVENT_ENTITY_COLS = ENTITY_COLS + ["Issues"]
+ROW_CODE_COLS = ["Suppliers", "Mills", "PIOConcessions", "Issues"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+
+CREATE TABLE IF NOT EXISTS entities (
+    kind TEXT NOT NULL, code INTEGER NOT NULL, name TEXT NOT NULL,
+    PRIMARY KEY (kind, code)
+);
+CREATE INDEX IF NOT EXISTS entities_name ON entities (kind, name);
+
+CREATE TABLE IF NOT EXISTS grievances (
+    id TEXT PRIMARY KEY, last_modified TEXT,
+    company_tracker TEXT, tracker_rec_ids TEXT
+);
+
+-- expanded Step 1 rows; entity code arrays as int32 blobs
+CREATE TABLE IF NOT EXISTS grievance_rows (
+    row_no INTEGER PRIMARY KEY, id TEXT, source INTEGER, date_filed TEXT,
+    raw_id INTEGER, row_id INTEGER,
+    suppliers BLOB, mills BLOB, pio BLOB, issues BLOB
+);
+CREATE INDEX IF NOT EXISTS grievance_rows_id ON grievance_rows (id);
+CREATE INDEX IF NOT EXISTS grievance_rows_source ON grievance_rows (source);
+
+CREATE TABLE IF NOT EXISTS events (
+    event_id TEXT PRIMARY KEY, source INTEGER, date_filed TEXT,
+    date_filed_list TEXT, mhid TEXT  -- date_filed_list: JSON array, null = no date
+);
+CREATE INDEX IF NOT EXISTS events_mhid ON events (mhid);
+
+-- posting lists: entity -> events
+CREATE TABLE IF NOT EXISTS event_entities (
+    event_id TEXT NOT NULL, kind TEXT NOT NULL, code INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS event_entities_posting ON event_entities (kind, code);
+CREATE INDEX IF NOT EXISTS event_entities_event ON event_entities (event_id);
+
+CREATE TABLE IF NOT EXISTS event_grievances (
+    event_id TEXT NOT NULL, grievance_id TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS event_grievances_event ON event_grievances (event_id);
+CREATE INDEX IF NOT EXISTS event_grievances_grievance ON event_grievances (grievance_id);
+
+CREATE VIEW IF NOT EXISTS lineage AS
+SELECT eg.grievance_id, e.event_id, e.mhid
+FROM event_grievances eg JOIN events e ON e.event_id = eg.event_id;
+"""
+
+
+def _blob(codes):
+    return np.asarray(codes, dtype=np.int32).tobytes()
+
+
+def _codes(blob):
+    return np.frombuffer(blob, dtype=np.int32).copy()
+
+
+def _date(d):
+    return None if pd.isna(d) else pd.Timestamp(d).isoformat()
+
+
+def _int(v):
+    return None if pd.isna(v) else int(v)
+
+
+def connect(path):
+    con = sqlite3.connect(path)
+    con.executescript(SCHEMA)
+    return con
+
+
+def clean(path):
+    """Nothing to write yet for a state that matches the store at path.
+    apply_export() adds the grievance IDs and Event_IDs it rewrites."""
+    return {"path": path, "grievances": set(), "events": set()}
+
+
+def _delete(con, table, key, ids):
+    con.executemany(f"DELETE FROM {table} WHERE {key} = ?", ((i,) for i in ids))
+
+
+def save(state, path):
+    """Write the state in one transaction. A state loaded from / saved to path
+    only rewrites what apply_export() changed since (state["dirty"]): the
+    grievances it re-read, the events of the affected Sources and the events of
+    the affected MHIDs. Anything else (new state, other path) is rewritten whole."""
+    dirty = state.get("dirty")
+    full = dirty is None or dirty["path"] != path
+    events, mhid_of = state["events"], state["mhid_of"]
+    rows = state["rows"]
+
+    con = connect(path)
+    try:
+        with con:
+            if full:
+                for table in ["meta", "entities", "grievances", "grievance_rows",
+                              "events", "event_entities", "event_grievances"]:
+                    con.execute(f"DELETE FROM {table}")
+                gids, eids = list(state["versions"]), list(events)
+            else:
+                gids, eids = dirty["grievances"], dirty["events"]
+                _delete(con, "grievances", "id", gids)
+                _delete(con, "grievance_rows", "id", gids)
+                for table in ["events", "event_entities", "event_grievances"]:
+                    _delete(con, table, "event_id", eids)
+                gids = [g for g in gids if g in state["versions"]]
+                eids = [e for e in eids if e in events]
+                if rows is not None:
+                    # rewritten IDs are the tail of state["rows"], so row_no order holds
+                    rows = rows[rows["ID"].isin(gids)]
+
+            con.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)", [
+                ("next_event", str(state["next_event"])),
+                ("next_mhid", str(state["next_mhid"])),
+                ("vocab_kinds", ",".join(state["vocabs"])),
+            ])
+            # vocabularies only grow: append the codes the store does not have yet
+            stored = dict(con.execute("SELECT kind, COUNT(*) FROM entities GROUP BY kind"))
+            con.executemany("INSERT INTO entities VALUES (?, ?, ?)", (
+                (kind, code, name)
+                for kind, vocab in state["vocabs"].items()
+                for code, name in enumerate(vocab.values[stored.get(kind, 0):], stored.get(kind, 0))
+            ))
+            con.executemany("INSERT INTO grievances VALUES (?, ?, ?, ?)", (
+                (gid, state["versions"][gid],
+                 state["tracker"].get(gid, {}).get("Company Tracker"),
+                 state["tracker"].get(gid, {}).get("Tracker Company AirtableRecIDs"))
+                for gid in gids
+            ))
+
+            if rows is not None and len(rows):
+                con.executemany(
+                    "INSERT INTO grievance_rows (id, source, date_filed, raw_id, row_id, suppliers, mills, pio, issues) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    zip(rows["ID"], map(_int, rows["Source"]), map(_date, rows["Date Filed"]),
+                        map(_int, rows["Raw_ID"]), map(_int, rows["Row_ID"]),
+                        *[map(_blob, rows[c]) for c in ROW_CODE_COLS])
+                )
+
+            # Date_Filed_List as a JSON array, undated grievances as null
+            con.executemany("INSERT INTO events VALUES (?, ?, ?, ?, ?)", (
+                (eid, int(events[eid]["Source"][0]), _date(events[eid]["Date_Filed"]),
+                 json.dumps([_date(d) for d in events[eid]["Date_Filed_List"]]), mhid_of.get(eid))
+                for eid in eids
+            ))
+            con.executemany("INSERT INTO event_entities VALUES (?, ?, ?)", (
+                (eid, col, int(c))
+                for eid in eids
+                for col in EVENT_ENTITY_COLS
+                for c in events[eid][col]
+            ))
+            con.executemany("INSERT INTO event_grievances VALUES (?, ?)", (
+                (eid, gid)
+                for eid in eids
+                for gid in events[eid]["Grievance_List"]
+            ))
+    finally:
+        con.close()
+    state["dirty"] = clean(path)
+
+
+def load(path, mhid_row):
+    """Read a saved state back into the in-memory structures incremental.py
+    works on. mhid_row(mhid, event_ids, events) rebuilds each MHID row."""
+    con = connect(path)
+    try:
+        meta = dict(con.execute("SELECT key, value FROM meta"))
+        kinds = meta["vocab_kinds"].split(",")
+        names = pd.read_sql_query("SELECT kind, code, name FROM entities ORDER BY kind, code", con)
+        vocabs = {k: Vocab.from_values(names.loc[names["kind"] == k, "name"]) for k in kinds}
+
+        versions, tracker = {}, {}
+        for gid, version, comp, rec in con.execute("SELECT * FROM grievances"):
+            versions[gid] = version
+            tracker[gid] = {"Company Tracker": comp if comp is not None else np.nan,
+                            "Tracker Company AirtableRecIDs": rec if rec is not None else np.nan}
+
+        g = pd.read_sql_query("SELECT * FROM grievance_rows ORDER BY row_no", con)
+        rows = pd.DataFrame({
+            "ID": g["id"],
+            "Date Filed": pd.to_datetime(g["date_filed"]),
+            **{c: g[blob].map(_codes) for c, blob in zip(ROW_CODE_COLS, ["suppliers", "mills", "pio", "issues"])},
+            "Raw_ID": g["raw_id"],
+            "Source": g["source"].astype("Int32"),
+            "Row_ID": g["row_id"],
+        })
+
+        events, mhid_of = {}, {}
+        for eid, source, date_filed, date_list, mhid in con.execute("SELECT * FROM events"):
+            events[eid] = {
+                "Event_ID": eid,
+                "Source": np.array([source], dtype=np.int32),
+                "Grievance_List": [],
+                "Date_Filed_List": list(pd.to_datetime(json.loads(date_list), format="ISO8601", errors="coerce")),
+                "Date_Filed": pd.Timestamp(date_filed) if date_filed else pd.NaT,
+            }
+            if mhid is not None:
+                mhid_of[eid] = mhid
+
+        postings = pd.read_sql_query("SELECT event_id, kind, code FROM event_entities", con)
+        for (eid, kind), codes in postings.groupby(["event_id", "kind"])["code"]:
+            events[eid][kind] = np.sort(codes.to_numpy(dtype=np.int32))
+        for evt in events.values():
+            for col in EVENT_ENTITY_COLS:
+                evt.setdefault(col, np.empty(0, dtype=np.int32))
+
+        for eid, gid in con.execute("SELECT event_id, grievance_id FROM event_grievances"):
+            events[eid]["Grievance_List"].append(gid)
+        for evt in events.values():
+            evt["Grievance_List"].sort()
+            evt["Grievance_Count"] = len(evt["Grievance_List"])
+    finally:
+        con.close()
+
+    index = new_index()
+    for eid, evt in events.items():
+        add_to_index(index, eid, {col: evt[col] for col in ENTITY_COLS})
+
+    members = {}
+    for eid in sorted(mhid_of, key=lambda e: int(e.split("_")[1])):
+        members.setdefault(mhid_of[eid], []).append(eid)
+
+    return {
+        "vocabs": vocabs,
+        "versions": versions,
+        "tracker": tracker,
+        "rows": rows,
+        "events": events,
+        "event_index": index,
+        "mhid_of": mhid_of,
+        "mhids": {m: mhid_row(m, eids, events) for m, eids in members.items()},
+        "next_event": int(meta["next_event"]),
+        "next_mhid": int(meta["next_mhid"]),
+        "dirty": clean(path),
+    }
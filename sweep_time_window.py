@@ -0,0 +1,86 @@
+# Time-window sweep for the cross-source merge (Step 3 of "Fix with timewindo.py").
+# Every candidate edge is generated once without a window, tagged with its gap
+# in days, and union-find is replayed in gap order: one run gives the MHID
+# count for every window 0..MAX_WINDOW_DAYS instead of one rerun per value.
+# The counts are for the pairwise edges only: Fix with timewindo.py also
+# re-tests merged clusters on their accumulated entities (step3_fixpoint), so
+# its MHID count at a window can be lower than the sweep's.
+#
+# Outputs:
+#   Sweep_TimeWindow.csv         Window_Days, MHID_Count, Largest_MHID_Events
+#   Sweep_TimeWindow_Merges.csv  the merge log (Gap_Days, Event_A, Event_B,
+#                                Merged_Events); the MHIDs at window w are the
+#                                components of the rows with Gap_Days <= w
+
+import sys
+
+import numpy as np
+import pandas as pd
+
+from loader import INPUT_FILE, load_normalized, expand_sources
+from incidence import entity_blocks, step3_edges
+from union_find import replay, sweep_counts
+from events import merge_per_source
+
+# =====================================================
+# CONFIG
+# =====================================================
+SWEEP_OUT = "Sweep_TimeWindow.csv"
+MERGES_OUT = "Sweep_TimeWindow_Merges.csv"
+MAX_WINDOW_DAYS = int(sys.argv[1]) if len(sys.argv) > 1 else 365
+
+# =====================================================
+# STEP 1 + 2 – same events as Fix with timewindo.py
+# =====================================================
+print("\n[STEP 1-2] Load, expand, merge per Source...")
+
+df, vocabs = load_normalized(INPUT_FILE)
+df_expanded = expand_sources(df)
+df_expanded["Source"] = vocabs["Source"].codes(df_expanded["Source"])
+
+df_step2 = merge_per_source(df_expanded)
+df_step2["Source"] = df_step2["Source"].apply(lambda s: np.array([s], dtype=np.int32))
+df_step2["Date_Filed"] = pd.to_datetime(df_step2["Date_Filed"], errors="coerce")
+print("✓ Step 2 events:", len(df_step2))
+
+# =====================================================
+# STEP 3 – ALL CANDIDATE EDGES + DAY GAP
+# =====================================================
+print("\n[STEP 3] Candidate edges (no window)...")
+
+# same rule as the windowed merge: supplier AND infra, supplier only if a side has no infra
+pairs = np.array(step3_edges(entity_blocks(df_step2, vocabs), relaxed=True), dtype=np.int64).reshape(-1, 2)
+
+dates = df_step2["Date_Filed"].to_numpy()
+gap = np.abs(dates[pairs[:, 0]] - dates[pairs[:, 1]])
+dated = ~np.isnat(gap)   # events without a date never pair
+pairs, gap_days = pairs[dated], (gap[dated] // np.timedelta64(1, "D")).astype(np.int64)
+print("✓ Candidate edges:", len(pairs))
+
+# =====================================================
+# SWEEP
+# =====================================================
+log = replay(len(df_step2), pairs.tolist(), gap_days.tolist())
+
+windows = list(range(MAX_WINDOW_DAYS + 1))
+counts, largest = sweep_counts(len(df_step2), log, windows)
+
+df_sweep = pd.DataFrame({
+    "Window_Days": windows,
+    "MHID_Count": counts,
+    "Largest_MHID_Events": largest
+})
+df_sweep.to_csv(SWEEP_OUT, index=False)
+
+event_ids = df_step2["Event_ID"].to_numpy()
+df_merges = pd.DataFrame(
+    [(g, event_ids[i], event_ids[j], s) for g, i, j, s in log],
+    columns=["Gap_Days", "Event_A", "Event_B", "Merged_Events"]
+)
+df_merges.to_csv(MERGES_OUT, index=False)
+
+print("\n✅ SWEEP DONE")
+for w in (0, 30, 60, 90, 180, 365):
+    if w <= MAX_WINDOW_DAYS:
+        print(f"  {w:>3} days -> {counts[w]} MHIDs")
+print("Output saved to:", SWEEP_OUT, "and", MERGES_OUT)
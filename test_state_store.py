@@ -0,0 +1,79 @@
+# Round trips of the incremental merge state through state_store.py
+# (python -m pytest test_state_store.py)
+
+import numpy as np
+import pandas as pd
+
+from incremental import new_state, apply_export, save_state, load_state
+from loader import GRIEVANCE_COLS
+
+
+def _export(rows):
+    """Parsed export as loader.load_grievances() returns it"""
+    df = pd.DataFrame(rows, columns=GRIEVANCE_COLS)
+    for col in ["Date Filed", "Created", "Last Modified"]:
+        df[col] = pd.to_datetime(df[col])
+    df["Raw_ID"] = df.index.astype(int)
+    return df
+
+
+def _grievance(gid, date_filed, supplier, mill, modified="2024-01-01"):
+    return {"ID": gid, "Date Filed": date_filed, "Source": "Rapid Response 1",
+            "Suppliers": supplier, "Mills": mill, "Issues": "Deforestation",
+            "Last Modified": modified}
+
+
+EXPORT = [
+    _grievance("G1", "2020-05-01", "Wilmar", "PO1000001"),
+    _grievance("G2", None, "Wilmar", "PO1000002"),           # undated, same event as G1
+    _grievance("G3", "2021-02-03", "Musim Mas", "PO1000003"),
+]
+
+
+def _events(state):
+    return {
+        tuple(evt["Grievance_List"]): (evt["Date_Filed"], evt["Date_Filed_List"], state["mhid_of"][eid])
+        for eid, evt in state["events"].items()
+    }
+
+
+def test_undated_grievance_round_trip(tmp_path):
+    path = str(tmp_path / "state.sqlite")
+    state = new_state()
+    apply_export(state, _export(EXPORT))
+    save_state(state, path)
+
+    loaded = load_state(path)
+    date_list = loaded["events"][next(e for e, evt in loaded["events"].items()
+                                      if evt["Grievance_List"] == ["G1", "G2"])]["Date_Filed_List"]
+    assert len(date_list) == 2
+    assert sum(pd.isna(d) for d in date_list) == 1
+    assert pd.Timestamp("2020-05-01") in date_list
+    assert _events(loaded) == _events(state)
+
+
+def test_delta_save_matches_full_save(tmp_path):
+    delta_path, full_path = str(tmp_path / "delta.sqlite"), str(tmp_path / "full.sqlite")
+    state = new_state()
+    apply_export(state, _export(EXPORT))
+    save_state(state, delta_path)
+
+    # G3 moves to G1's mill, G2 is deleted, G4 is new
+    state = load_state(delta_path)
+    apply_export(state, _export([
+        EXPORT[0],
+        _grievance("G3", "2021-02-03", "Musim Mas", "PO1000001", modified="2024-02-01"),
+        _grievance("G4", None, "Musim Mas", "PO1000004"),
+    ]))
+    save_state(state, delta_path)
+    state["dirty"] = None
+    save_state(state, full_path)
+
+    delta, full = load_state(delta_path), load_state(full_path)
+    assert _events(delta) == _events(full)
+    assert delta["versions"] == full["versions"]
+    assert {k: v.values for k, v in delta["vocabs"].items()} == {k: v.values for k, v in full["vocabs"].items()}
+    pd.testing.assert_frame_equal(delta["rows"], full["rows"])
+    for m, row in full["mhids"].items():
+        assert delta["mhids"][m]["Grievance_List"] == row["Grievance_List"]
+        assert np.array_equal(delta["mhids"][m]["Suppliers"], row["Suppliers"])
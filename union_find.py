@@ -0,0 +1,125 @@
+# Disjoint-set (union-find) clustering engine.
+# Rows that share an entity end up in the same cluster no matter the row order,
+# including two events that only a later row bridges (connected components,
+# same semantics as the recursive CTE in "Fixx duckcb 2 step.sql").
+
+import numpy as np
+
+from entity_index import new_index, add_to_index
+
+
+class DisjointSet:
+    """Union-find with path compression and union by rank"""
+
+    def __init__(self, n=0):
+        self.parent = list(range(n))
+        self.rank = [0] * n
+
+    def add(self):
+        self.parent.append(len(self.parent))
+        self.rank.append(0)
+        return len(self.parent) - 1
+
+    def find(self, x):
+        root = x
+        while self.parent[root] != root:
+            root = self.parent[root]
+        # path compression
+        while self.parent[x] != root:
+            self.parent[x], x = root, self.parent[x]
+        return root
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra == rb:
+            return ra
+        if self.rank[ra] < self.rank[rb]:
+            ra, rb = rb, ra
+        self.parent[rb] = ra
+        if self.rank[ra] == self.rank[rb]:
+            self.rank[ra] += 1
+        return ra
+
+    def labels(self):
+        """Dense cluster label per element, numbered by first appearance"""
+        seen = {}
+        out = []
+        for i in range(len(self.parent)):
+            out.append(seen.setdefault(self.find(i), len(seen)))
+        return out
+
+
+def cluster_entities(rows, cols):
+    """rows = list of {column: iterable of IDs}; rows sharing any ID in any
+    column are connected. Returns one dense label per row."""
+    ds = DisjointSet(len(rows))
+    index = new_index(cols)
+    for i, entities in enumerate(rows):
+        add_to_index(index, i, entities)
+    for postings in index.values():
+        for members in postings.values():
+            it = iter(members)
+            first = next(it)
+            for m in it:
+                ds.union(first, m)
+    return ds.labels()
+
+
+def cluster_keys(n, rows, keys):
+    """Connected components of n rows given (row, key) arrays: rows sharing a
+    key are connected (consecutive rows of each key after one sort)"""
+    rows, keys = np.asarray(rows), np.asarray(keys)
+    order = np.lexsort((rows, keys))
+    rows, keys = rows[order], keys[order]
+    same = keys[1:] == keys[:-1]
+    return cluster_pairs(n, zip(rows[:-1][same].tolist(), rows[1:][same].tolist()))
+
+
+def cluster_pairs(n, pairs):
+    """Connected components of n elements given (i, j) edges"""
+    ds = DisjointSet(n)
+    for i, j in pairs:
+        ds.union(i, j)
+    return ds.labels()
+
+
+def group_members(labels):
+    """[[element positions of cluster 0], [cluster 1], ...] in label order"""
+    groups = {}
+    for i, lab in enumerate(labels):
+        groups.setdefault(lab, []).append(i)
+    return [groups[k] for k in sorted(groups)]
+
+
+def replay(n, edges, keys):
+    """Union (i, j) edges in ascending key order (gap in days, -score, ...).
+    Returns the merge log: one (key, i, j, merged_size) per union that joined
+    two clusters. n - (merges with key <= k) is the cluster count at level k,
+    and cluster_pairs(n, [(i, j) for key, i, j, _ in log if key <= k]) the
+    assignment."""
+    ds = DisjointSet(n)
+    size = [1] * n
+    log = []
+    for e in sorted(range(len(edges)), key=lambda e: keys[e]):
+        i, j = edges[e]
+        ri, rj = ds.find(i), ds.find(j)
+        if ri == rj:
+            continue
+        root = ds.union(ri, rj)
+        size[root] = size[ri] + size[rj]
+        log.append((keys[e], i, j, size[root]))
+    return log
+
+
+def sweep_counts(n, log, levels):
+    """Cluster count and largest cluster size at each level (ascending),
+    from a replay() merge log"""
+    counts, largest = [], []
+    done, biggest = 0, 1 if n else 0
+    for level in levels:
+        while done < len(log) and log[done][0] <= level:
+            biggest = max(biggest, log[done][3])
+            done += 1
+        counts.append(n - done)
+        largest.append(biggest)
+    return counts, largest
@@ -0,0 +1,74 @@
+# Integer-interned entity vocabulary.
+# Every distinct Supplier, Mill, PIOConcession, Source and Issue gets a dense
+# int32 code; rows carry sorted unique int32 arrays instead of lists of
+# strings. Clustering works on the codes, names come back only at export.
+
+import numpy as np
+import pandas as pd
+
+VOCAB_COLS = ["Suppliers", "Mills", "PIOConcessions", "Source", "Issues"]
+
+EMPTY = np.empty(0, dtype=np.int32)
+
+
+class Vocab:
+    """value <-> dense int32 code, numbered by first appearance"""
+
+    def __init__(self):
+        self.code_of = {}
+        self.values = []
+
+    @classmethod
+    def from_values(cls, values):
+        """Rebuild from names listed in code order (e.g. from a saved state)"""
+        v = cls()
+        v.values = list(values)
+        v.code_of = {name: c for c, name in enumerate(v.values)}
+        return v
+
+    def __len__(self):
+        return len(self.values)
+
+    def code(self, value):
+        c = self.code_of.get(value)
+        if c is None:
+            c = self.code_of[value] = len(self.values)
+            self.values.append(value)
+        return c
+
+    def encode(self, values):
+        """Iterable of names -> sorted unique int32 array"""
+        codes = np.fromiter((self.code(v) for v in values), dtype=np.int32)
+        return np.unique(codes) if len(codes) else EMPTY
+
+    def decode(self, codes):
+        """int array -> sorted list of names"""
+        return sorted(self.values[c] for c in codes)
+
+    def codes(self, series):
+        """Scalar column (e.g. one Source per row) -> Int32 codes, NA kept.
+        New values are interned in name order so groupby on the codes walks
+        the groups in the same order as groupby on the strings."""
+        for v in sorted(v for v in series.unique() if isinstance(v, str)):
+            self.code(v)
+        return series.map(lambda v: self.code(v) if isinstance(v, str) else pd.NA).astype("Int32")
+
+
+def new_vocabs(cols=VOCAB_COLS):
+    return {col: Vocab() for col in cols}
+
+
+def union_codes(arrays):
+    """Sorted union of several code arrays"""
+    arrays = [a for a in arrays if len(a)]
+    if not arrays:
+        return EMPTY
+    return np.unique(np.concatenate(arrays))
+
+
+def decode_columns(df, vocabs, cols=VOCAB_COLS):
+    """Replace code arrays with sorted name lists (export only)"""
+    for col in cols:
+        if col in df.columns:
+            df[col] = df[col].apply(vocabs[col].decode)
+    return df